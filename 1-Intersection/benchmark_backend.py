@@ -0,0 +1,45 @@
+import os
+import sys
+import subprocess
+import timeit
+
+BACKENDS = ['traci', 'libsumo']
+EPISODES = 3
+
+
+def run_backend():
+    """
+    Run episodes of the stochastic baseline (mode 1, no model needed) with the backend of SUMO_BACKEND and return the simulated steps per second
+    """
+    from training_simulation import Simulation
+    from environment import Environment
+    from generator import TrafficGenerator
+    from memory import Memory
+    from utils import import_train_configuration, set_sumo
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    sumo_cmd = set_sumo(False, config['sumocfg_file_name'], config['max_steps'])
+    memory = Memory(config['memory_size_max'], config['memory_size_min'])
+    traffic_gen = TrafficGenerator(memory, config['max_steps'], config['n_cars_generated'])
+    environment = Environment(traffic_gen, sumo_cmd, config['max_steps'], config['green_duration'], config['yellow_duration'], config['num_states'],
+                              config['reward'], config['observation'], config['persistent_sumo'])
+    simulation = Simulation(None, memory, environment, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], config['training_epochs'], 1)
+
+    start_time = timeit.default_timer()
+    for episode in range(EPISODES):
+        simulation.run(episode, 1.0)
+    simulation.close()
+    return EPISODES * config['max_steps'] / (timeit.default_timer() - start_time)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:  # child process, the backend is selected only once per process
+        print(run_backend())
+    else:
+        steps_per_second = {}
+        for backend in BACKENDS:
+            output = subprocess.run([sys.executable, __file__, 'child'], env=dict(os.environ, SUMO_BACKEND=backend), capture_output=True, text=True, check=True).stdout
+            steps_per_second[backend] = float(output.split()[-1])
+            print("%-8s %8.1f steps/s" % (backend, steps_per_second[backend]))
+        print("libsumo speedup: %.2fx" % (steps_per_second['libsumo'] / steps_per_second['traci']))
@@ -0,0 +1,51 @@
+import os
+import sys
+import subprocess
+import importlib
+import timeit
+
+ENTRY_POINTS = [('training_main', 'mode 0'), ('training_main', 'mode 1'), ('training_main', 'mode 2'), ('testing_main', 'keras'), ('testing_main', 'numpy'), ('testing_main', 'tflite')]
+HEAVY_MODULES = ['tensorflow', 'matplotlib']
+
+
+def measure_startup(entry_point, setting):
+    """
+    Import the entry point and build its model with the given setting, returns the import time, the initialization time and the heavy modules loaded
+    """
+    from utils import import_train_configuration, import_test_configuration
+
+    start_time = timeit.default_timer()
+    main = importlib.import_module(entry_point)
+    import_time = timeit.default_timer() - start_time
+
+    start_time = timeit.default_timer()
+    if entry_point == 'training_main':
+        config = import_train_configuration(config_file='training_settings.ini')
+        config['mode'] = int(setting.split()[-1])
+        main.build_model(config)
+    else:
+        config = import_test_configuration(config_file='testing_settings.ini')
+        config['inference'] = setting
+        main.build_model(config, os.path.join(os.getcwd(), config['models_path_name'], 'model_' + str(config['model_to_test']), ''))
+    init_time = timeit.default_timer() - start_time
+
+    return import_time, init_time, [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:  # child process, every entry point starts from a fresh interpreter
+        import_time, init_time, loaded = measure_startup(sys.argv[1], sys.argv[2])
+        print(import_time, init_time, ','.join(loaded) or '-')
+    else:
+        for entry_point, setting in ENTRY_POINTS:
+            name = entry_point + ' (' + setting + ')'
+            start_time = timeit.default_timer()
+            result = subprocess.run([sys.executable, __file__, entry_point, setting], capture_output=True, text=True)
+            process_time = timeit.default_timer() - start_time
+
+            if result.returncode != 0:  # e.g. tensorflow not installed, or no exported weights for the model to test
+                print("%-24s not available: %s" % (name, (result.stderr or result.stdout).strip().splitlines()[-1]))
+                continue
+            import_time, init_time, loaded = result.stdout.split()[-3:]
+            print("%-24s import: %6.2f s - init: %6.2f s - process: %6.2f s - loaded: %s" % (name, float(import_time), float(init_time), process_time, loaded))
@@ -0,0 +1,46 @@
+import timeit
+import numpy as np
+
+from training_simulation import Simulation
+from benchmark_replay import random_memory
+from utils import import_train_configuration
+
+EPISODES = 3  # after one warmup episode, that builds the fit machinery or traces the compiled loop
+
+
+def legacy_train(simulation, keras_model, epochs):
+    """
+    Training of an episode as it was done before the compiled train step, one keras fit call for each replay, kept as reference
+    """
+    for _ in range(epochs):
+        batch = simulation._Memory.get_samples(simulation._Model.batch_size)
+        states, actions, rewards, next_states = batch[:4]  # the weights are all 1 with uniform draws
+        q_s_a, q_s_a_d = np.split(simulation._Model.predict_batch(np.concatenate((states, next_states))), 2)
+        q_s_a[np.arange(len(states)), actions] = rewards + simulation._gamma * np.amax(q_s_a_d, axis=1)
+        keras_model.fit(states, q_s_a, epochs=1, verbose=0)
+
+
+def training_time(train, epochs):
+    """
+    Average training time of an episode, after the warmup episode
+    """
+    train(epochs)
+    start_time = timeit.default_timer()
+    for _ in range(EPISODES):
+        train(epochs)
+    return (timeit.default_timer() - start_time) / EPISODES
+
+
+if __name__ == "__main__":
+
+    from model import TrainModel
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    memory = random_memory(config, np.random.default_rng(0))
+    Model = TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'])
+    simulation = Simulation(Model, memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], config['training_epochs'], 0)
+
+    legacy_time = training_time(lambda epochs: legacy_train(simulation, Model._model, epochs), config['training_epochs'])
+    compiled_time = training_time(simulation.train, config['training_epochs'])
+    print("training time per episode (%d replays of %d samples) - fit: %.2f s - compiled: %.2f s - speedup: %.1fx" % (
+        config['training_epochs'], config['batch_size'], legacy_time, compiled_time, legacy_time / compiled_time))
@@ -0,0 +1,142 @@
+import numpy as np
+import xml.etree.ElementTree as ET
+import os
+
+from sumo_backend import tc
+
+DETECTOR_FILE = 'detectors.add.xml'
+CROSSING_ZONE = 25  # meters covered after a crossing, more than a car drives in one step at the speed limit plus its length
+
+
+class CellDetectors:
+    def __init__(self, StateEncoder, prefix):
+        self._num_states = StateEncoder.num_states
+        self._detectors = []
+        cell_index = []
+        for lane_id, index, start_pos, end_pos in StateEncoder.cells():  # one lane area detector per lane and cell
+            self._detectors.append(("%s_%i_%s" % (prefix, index, lane_id), lane_id, start_pos, end_pos))
+            cell_index.append(index)
+        self._detector_row = {detector[0]: i for i, detector in enumerate(self._detectors)}
+        self._cell_index = np.array(cell_index, dtype=np.intp)
+
+
+    def get_state(self, results):
+        """
+        Build the cell occupancy state from the number of cars seen by every detector in the last step
+        """
+        counts = np.zeros(len(self._detectors))
+        for detector_id, values in results.items():
+            row = self._detector_row.get(detector_id)
+            if row is not None:
+                counts[row] = values[tc.LAST_STEP_VEHICLE_NUMBER]
+
+        state = np.zeros(self._num_states)
+        state[self._cell_index[counts > 0]] = 1  # a cell is occupied if any of its lanes has a car on the detector
+        return state
+
+
+    def elements(self):
+        """
+        Lines of the additional file that define the detectors
+        """
+        for detector_id, lane_id, start_pos, end_pos in self._detectors:
+            yield '    <laneAreaDetector id="%s" lane="%s" pos="%.2f" endPos="%.2f" period="86400" file="NUL"/>' % (detector_id, lane_id, start_pos, end_pos)
+
+
+class WaitingTimeDetectors:
+    def __init__(self, net_file, road_groups, prefix):
+        """
+        Multi-entry-exit detectors that see the cars crossing into or out of the incoming roads of every group,
+        so that the accumulated waiting time of the cars on the roads is followed without reading the cars at every step
+        """
+        root = ET.parse(net_file).getroot()
+        roads = {edge.get('id'): edge for edge in root.iter('edge') if edge.get('function') != 'internal'}
+        dead_ends = {junction.get('id') for junction in root.iter('junction') if junction.get('type') == 'dead_end'}
+        lanes = {road_id: [(lane.get('id'), float(lane.get('length'))) for lane in edge.iter('lane')] for road_id, edge in roads.items()}
+
+        self._detectors = []
+        for group, road_ids in enumerate(road_groups):
+            # a car leaves the group when it passes the stop line, it is seen until it is well into the next road
+            junctions = {roads[road_id].get('to') for road_id in road_ids}
+            entries = [(lane_id, length) for road_id in road_ids for lane_id, length in lanes[road_id]]
+            exits = [(lane_id, min(length, CROSSING_ZONE)) for road_id, edge in roads.items() if edge.get('from') in junctions for lane_id, length in lanes[road_id]]
+            self._detectors.append(("%s_leave_%i" % (prefix, group), group, -1, entries, exits))
+
+            # a car enters the group from another intersection at the start of a road between the traffic lights
+            inner_roads = [road_id for road_id in road_ids if roads[road_id].get('from') not in dead_ends]
+            if inner_roads:
+                entries = [(lane_id, 0) for road_id in inner_roads for lane_id, length in lanes[road_id]]
+                exits = [(lane_id, min(length, CROSSING_ZONE)) for road_id in inner_roads for lane_id, length in lanes[road_id]]
+                self._detectors.append(("%s_enter_%i" % (prefix, group), group, 1, entries, exits))
+
+        self._num_groups = len(road_groups)
+        self.reset()
+
+
+    def reset(self):
+        """
+        Forget the cars and the waiting time of the previous episode, to be called every time a new simulation is started
+        """
+        self._inside = {detector[0]: set() for detector in self._detectors}
+        self._totals = [0] * self._num_groups
+
+
+    def crossings(self, results):
+        """
+        Find the cars that crossed into a detector in the last step from the cars seen by every detector,
+        returns the car id, the group and whether the car enters (1) or leaves (-1) the group
+        """
+        crossings = []
+        for detector_id, group, sign, entries, exits in self._detectors:
+            inside = set(results.get(detector_id, {}).get(tc.LAST_STEP_VEHICLE_ID_LIST, ()))
+            crossings.extend((car_id, group, sign) for car_id in inside - self._inside[detector_id])
+            self._inside[detector_id] = inside  # only the cars between a crossing and the end of its zone are kept
+        return crossings
+
+
+    def update(self, halting_numbers, crossing_waiting_times):
+        """
+        Every car halting on the roads of a group in the last step waited one more second,
+        the cars that crossed into or out of the roads bring or take away the waiting time they accumulated so far
+        """
+        for group, halting_number in enumerate(halting_numbers):
+            self._totals[group] += halting_number
+        for group, sign, waiting_time in crossing_waiting_times:
+            self._totals[group] += sign * waiting_time
+
+
+    def elements(self):
+        """
+        Lines of the additional file that define the detectors
+        """
+        for detector_id, group, sign, entries, exits in self._detectors:
+            yield '    <entryExitDetector id="%s" period="86400" file="NUL">' % detector_id
+            for lane_id, pos in entries:
+                yield '        <detEntry lane="%s" pos="%.2f"/>' % (lane_id, pos)
+            for lane_id, pos in exits:
+                yield '        <detExit lane="%s" pos="%.2f"/>' % (lane_id, pos)
+            yield '    </entryExitDetector>'
+
+
+    @property
+    def detector_ids(self):
+        return [detector[0] for detector in self._detectors]
+
+
+    @property
+    def totals(self):
+        return self._totals
+
+
+def write_detector_file(path, detector_sets):
+    """
+    Produce the additional file with the detectors of every set, to be loaded by sumo at start
+    """
+    temporary_path = path + "." + str(os.getpid())  # the actor processes of the parallel rollouts write it at the same time
+    with open(temporary_path, "w") as additional:
+        print("<additional>", file=additional)
+        for detector_set in detector_sets:
+            for element in detector_set.elements():
+                print(element, file=additional)
+        print("</additional>", file=additional)
+    os.replace(temporary_path, path)
@@ -0,0 +1,308 @@
+import timeit
+import os
+
+from sumo_backend import traci, tc
+from detectors import CellDetectors, WaitingTimeDetectors, write_detector_file, DETECTOR_FILE
+from observation_cache import ObservationCache, cached_observation
+from state_encoder import StateEncoder, LANE_GROUPS, CELL_BOUNDARIES
+
+# phase codes based on environment.net.xml
+PHASE_NS_GREEN = 0  # action 0 code 00
+PHASE_NS_YELLOW = 1
+PHASE_NSL_GREEN = 2  # action 1 code 01
+PHASE_NSL_YELLOW = 3
+PHASE_EW_GREEN = 4  # action 2 code 10
+PHASE_EW_YELLOW = 5
+PHASE_EWL_GREEN = 6  # action 3 code 11
+PHASE_EWL_YELLOW = 7
+
+CONTEXT_RANGE = 2000  # meters around the traffic light, covers every lane of environment.net.xml
+INCOMING_ROADS = ["E2TL", "N2TL", "W2TL", "S2TL"]
+
+
+class Environment:
+    def __init__(self, TrafficGen, sumo_cmd, max_steps, green_duration, yellow_duration, num_states, reward, observation, persistent_sumo=False, sumo_label='default', sumo_port=None):
+        self._TrafficGen = TrafficGen
+        self._step = 0
+        self._sumo_cmd = sumo_cmd
+        self._max_steps = max_steps
+        self._green_duration = green_duration
+        self._yellow_duration = yellow_duration
+        self._reward_type = reward
+        self._observation = observation
+        self._ObservationCache = ObservationCache()
+        self._persistent_sumo = persistent_sumo
+        self._sumo_label = sumo_label
+        self._sumo_port = sumo_port
+        self._sumo_running = False
+        self._sumo_startup_time = 0
+        self._saved_startup_time = 0
+        self._StateEncoder = StateEncoder(os.path.join('intersection', 'environment.net.xml'), num_states, LANE_GROUPS, CELL_BOUNDARIES)
+        self._WaitingTimeDetectors = WaitingTimeDetectors(os.path.join('intersection', 'environment.net.xml'), [INCOMING_ROADS], 'wait')
+        detector_sets = [self._WaitingTimeDetectors]
+
+        if observation == 'detector':  # lane area detectors loaded by sumo together with the network
+            self._CellDetectors = CellDetectors(self._StateEncoder, 'cell')
+            detector_sets.append(self._CellDetectors)
+
+        detector_file = os.path.join('intersection', DETECTOR_FILE)
+        write_detector_file(detector_file, detector_sets)
+        self._sumo_cmd = sumo_cmd + ["--additional-files", detector_file]
+
+
+    def reset(self, seed):
+        """
+        Generate the route file of the episode, set up sumo and return the first state of the intersection
+        """
+        self._TrafficGen.generate_routefile(seed=seed)
+        self._start_sumo()
+
+        self._step = 0
+        self._ObservationCache.reset()
+        self._old_total_wait = 0
+        self._old_queue_length = 0
+        self._old_action = -1
+        return self._observe()
+
+
+    def step(self, action):
+        """
+        Activate the light phase of the action, through the yellow phase if it changes, and simulate up to the next decision,
+        returns the next state, the reward of the action, whether the episode is over and the queue length of every simulated step
+        """
+        info = {'queue_lengths': []}
+
+        # if the chosen phase is different from the last phase, activate the yellow phase
+        if self._step != 0 and self._old_action != action:
+            self._set_yellow_phase(self._old_action)
+            self._simulate(self._yellow_duration, info)
+
+        # execute the phase selected before
+        self._set_green_phase(action)
+        self._simulate(self._green_duration, info)
+        self._old_action = action
+        info['step'] = self._step
+
+        if self._step >= self._max_steps:  # nothing left to decide, the last action is not rewarded
+            if not self._persistent_sumo:  # otherwise the next episode is loaded in the same sumo process
+                self.close()
+            return None, None, True, info
+
+        state = self._observe()
+        return state, self._reward, False, info
+
+
+    def _observe(self):
+        """
+        Retrieve the state of the intersection and compute the reward of the previous action
+        """
+        # get current state of the intersection
+        current_state = self._get_state()
+
+        # waiting time = seconds waited by a car since the spawn in the environment, cumulated for every car in incoming lanes
+        current_total_wait = self._collect_waiting_times()
+
+        # get number of cars for each incoming lane (reward input)
+        current_queue_length = self._get_queue_length()
+
+        # calculate reward of previous action
+        self._reward = self._calculate_reward(self._old_total_wait, current_total_wait, self._old_queue_length, current_queue_length)
+
+        self._old_total_wait = current_total_wait
+        self._old_queue_length = current_queue_length
+        return current_state
+
+
+    def _start_sumo(self):
+        """
+        Start sumo, or load the new episode in the sumo process kept alive from the previous one
+        """
+        start_time = timeit.default_timer()
+        if self._sumo_running:
+            traci.load(self._sumo_cmd[1:])  # same options without the binary, sumo reads the new route file
+            self._saved_startup_time = round(self._sumo_startup_time - (timeit.default_timer() - start_time), 2)
+        else:
+            traci.start(self._sumo_cmd, port=self._sumo_port, label=self._sumo_label)
+            self._sumo_running = True
+            self._sumo_startup_time = timeit.default_timer() - start_time
+
+        self._WaitingTimeDetectors.reset()
+        for detector_id in self._WaitingTimeDetectors.detector_ids:  # sumo drops the subscriptions when it loads an episode
+            traci.multientryexit.subscribe(detector_id, [tc.LAST_STEP_VEHICLE_ID_LIST])
+
+
+    def close(self):
+        """
+        Close sumo, to be called at the end of the session when sumo is kept alive between the episodes
+        """
+        if self._sumo_running:
+            traci.close()
+            self._sumo_running = False
+
+
+    def _simulate(self, steps_todo, info):
+        """
+        Execute steps in sumo while gathering the queue length of every step
+        """
+        if (self._step + steps_todo) >= self._max_steps:  # do not do more steps than the maximum allowed number of steps
+            steps_todo = self._max_steps - self._step
+
+        while steps_todo > 0:
+            self._ObservationCache.step()  # simulate 1 step in sumo, the values read before are outdated
+            self._step += 1 # update the step counter
+            steps_todo -= 1
+            queue_length = self._get_queue_length()  # get number of cars for each incoming lane
+            info['queue_lengths'].append(queue_length)
+            self._WaitingTimeDetectors.update([queue_length], self._get_crossing_waiting_times())
+
+
+    @cached_observation(lambda self, waiting_times: len(waiting_times))
+    def _get_crossing_waiting_times(self):
+        """
+        Retrieve the accumulated waiting time of the cars that crossed into or out of the incoming roads in the last step,
+        the detectors are subscribed and only the crossing cars are read
+        """
+        crossings = self._WaitingTimeDetectors.crossings(traci.multientryexit.getAllSubscriptionResults())
+        return [(group, sign, traci.vehicle.getAccumulatedWaitingTime(car_id)) for car_id, group, sign in crossings]
+
+
+    def _collect_waiting_times(self):
+        """
+        Retrieve the accumulated waiting time of every car in the incoming roads, followed step by step by the detectors
+        """
+        return self._WaitingTimeDetectors.totals[0]
+
+
+    def _set_yellow_phase(self, old_action):
+        """
+        Activate the correct yellow light combination in sumo
+        """
+        yellow_phase_code = old_action * 2 + 1 # obtain the yellow phase code, based on the old action (ref on environment.net.xml)
+        traci.trafficlight.setPhase("TL", yellow_phase_code)
+
+
+    def _set_green_phase(self, action_number):
+        """
+        Activate the correct green light combination in sumo
+        """
+        if action_number == 0:
+            traci.trafficlight.setPhase("TL", PHASE_NS_GREEN)  # straight
+        elif action_number == 1:
+            traci.trafficlight.setPhase("TL", PHASE_NSL_GREEN) # turn left
+        elif action_number == 2:
+            traci.trafficlight.setPhase("TL", PHASE_EW_GREEN)  # straight
+        elif action_number == 3:
+            traci.trafficlight.setPhase("TL", PHASE_EWL_GREEN) # turn left
+
+
+    @cached_observation(4)
+    def _get_queue_length(self):
+        """
+        Retrieve the number of cars with speed = 0 in every incoming lane
+        """
+        halt_N = traci.edge.getLastStepHaltingNumber("N2TL")
+        halt_S = traci.edge.getLastStepHaltingNumber("S2TL")
+        halt_E = traci.edge.getLastStepHaltingNumber("E2TL")
+        halt_W = traci.edge.getLastStepHaltingNumber("W2TL")
+
+        queue_length = halt_N + halt_S + halt_E + halt_W
+
+        return queue_length
+
+
+    @cached_observation(1)
+    def _get_arrived_number(self):
+        """
+        Retrieve the number of cars that reached their destination in the last step
+        """
+        return traci.simulation.getArrivedNumber()
+
+
+    @cached_observation(1)
+    def _get_departed_number(self):
+        """
+        Retrieve the number of cars that entered the network in the last step
+        """
+        return traci.simulation.getDepartedNumber()
+
+
+    @cached_observation(lambda self, positions: 3 if self._observation == 'subscription' else 1 + 2 * len(positions[0]))
+    def _get_vehicle_positions(self):
+        """
+        Retrieve the lane id and the lane position of every car in the simulation
+        """
+        if self._observation == 'subscription':  # one bulk response for every car in the network
+            traci.junction.subscribeContext("TL", tc.CMD_GET_VEHICLE_VARIABLE, CONTEXT_RANGE, [tc.VAR_LANE_ID, tc.VAR_LANEPOSITION])
+            results = traci.junction.getContextSubscriptionResults("TL")
+            traci.junction.unsubscribeContext("TL", tc.CMD_GET_VEHICLE_VARIABLE, CONTEXT_RANGE)
+            return [values[tc.VAR_LANE_ID] for values in results.values()], [values[tc.VAR_LANEPOSITION] for values in results.values()]
+
+        car_list = traci.vehicle.getIDList()
+        return [traci.vehicle.getLaneID(car_id) for car_id in car_list], [traci.vehicle.getLanePosition(car_id) for car_id in car_list]
+
+
+    @cached_observation(3)
+    def _get_detector_results(self):
+        """
+        Retrieve the number of cars on every lane area detector in one bulk response
+        """
+        traci.junction.subscribeContext("TL", tc.CMD_GET_LANEAREA_VARIABLE, CONTEXT_RANGE, [tc.LAST_STEP_VEHICLE_NUMBER])
+        results = traci.junction.getContextSubscriptionResults("TL")
+        traci.junction.unsubscribeContext("TL", tc.CMD_GET_LANEAREA_VARIABLE, CONTEXT_RANGE)
+        return results
+
+
+    def _get_state(self):
+        """
+        Retrieve the state of the intersection from sumo, in the form of cell occupancy
+        """
+        if self._observation == 'detector':
+            return self._CellDetectors.get_state(self._get_detector_results())
+
+        lane_ids, lane_positions = self._get_vehicle_positions()
+        return self._StateEncoder.encode(lane_ids, lane_positions)
+
+
+    def _calculate_reward(self,old_total_wait,current_total_wait,old_queue_length,current_queue_length):
+        """
+        Computes the chosen reward
+        """
+        # boolean parameter to choose reward
+        if self._reward_type == 0:
+            r = old_total_wait - current_total_wait
+        elif self._reward_type == 1:
+            r = -current_total_wait
+        elif self._reward_type == 2:
+            r= old_queue_length-current_queue_length
+        elif self._reward_type == 3:
+            r= -current_queue_length
+        elif self._reward_type == 4:
+            r= self._get_arrived_number()
+        elif self._reward_type == 5:
+            r= self._get_arrived_number() - self._get_departed_number()
+        else :
+            print("Reward still to be defined")
+
+        return r
+
+
+    def summary(self):
+        """
+        TraCI calls of the last episode, sent and saved by the observation cache
+        """
+        return self._ObservationCache.summary()
+
+
+    @property
+    def reward(self):
+        return self._reward  # of the last state returned, after reset there is no action to reward yet
+
+
+    @property
+    def reward_type(self):
+        return self._reward_type
+
+
+    @property
+    def saved_startup_time(self):
+        return self._saved_startup_time
@@ -0,0 +1,160 @@
+import threading
+import timeit
+
+from training_simulation import Simulation
+
+WAIT_TIME = 0.05  # seconds between two checks of the learner while not enough transitions have arrived
+
+
+class SharedMemory:  # stands for the Memory while the learner thread samples from it, counts the transitions added by the simulation
+    def __init__(self, Memory):
+        self._Memory = Memory
+        self._lock = threading.Lock()  # adding and sampling at the same time would read the samples while they are removed
+        self._samples_added = {}
+
+
+    def add_sample(self, sample, *agent_id):
+        with self._lock:
+            self._Memory.add_sample(sample, *agent_id)
+            self._samples_added[agent_id[:1]] = self._samples_added.get(agent_id[:1], 0) + 1  # by agent, without the time of the sample
+
+
+    def get_samples(self, n, *agent_id):
+        with self._lock:
+            return self._Memory.get_samples(n, *agent_id)
+
+
+    def update_priorities(self, indices, td_errors, *agent_id):
+        with self._lock:
+            self._Memory.update_priorities(indices, td_errors, *agent_id)
+
+
+    def flush(self):
+        with self._lock:
+            self._Memory.flush()
+
+
+    @property
+    def transitions_added(self):
+        return min(self._samples_added.values(), default=0)  # with more agents, a transition once every agent has its sample
+
+
+class SharedModel:  # stands for the acting model while the learner publishes its weights into it from its thread
+    def __init__(self, Model):
+        self._Model = Model
+        self._lock = threading.Lock()  # the weights are set layer by layer, a prediction meanwhile would mix two publications
+
+
+    def __getattr__(self, name):
+        return getattr(self._Model, name)  # the rest of the interface of the model
+
+
+    def predict_one(self, *args):
+        with self._lock:
+            return self._Model.predict_one(*args)
+
+
+    def predict_batch(self, *args):
+        with self._lock:
+            return self._Model.predict_batch(*args)
+
+
+    def set_weights(self, weights):
+        with self._lock:
+            self._Model.set_weights(weights)
+
+
+class AsyncLearner:
+    def __init__(self, config, Model, ActingModel, Memory):
+        self._Model = Model
+        self._ActingModel = ActingModel
+        self._Memory = Memory
+        self._steps_per_transition = config['gradient_steps_per_transition']
+        self._publish_interval = config['publish_interval']
+        self._simulation = Simulation(Model, Memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'],
+                                      0, config['mode'])  # replays the memory with the model being trained, no episode is simulated
+        self._scheduled_steps = 0  # gradient steps due so far, applied or skipped while the memory was not full enough
+        self._gradient_steps = 0
+        self._publications = 0
+        self._training_time = 0
+        self._reported = (0, 0, timeit.default_timer())  # gradient steps, training time and time of the last report
+        self._error = None
+        self._stop = threading.Event()
+
+        self._publish()  # the acting model starts from the same weights
+        self._thread = threading.Thread(target=self._learn, daemon=True)
+        self._thread.start()
+
+
+    def _learn(self):
+        """
+        Apply the gradient steps due for the transitions added to the memory, in chunks of the publish interval each followed by a publication,
+        until the learner is closed
+        """
+        try:
+            while not self._stop.is_set():
+                if self._due_steps() >= self._publish_interval:
+                    self._train(self._publish_interval)
+                else:
+                    self._stop.wait(WAIT_TIME)
+        except Exception as error:  # raised again in the main thread by report or close
+            self._error = error
+
+
+    def _due_steps(self):
+        """
+        Number of gradient steps not applied yet, according to the transitions added to the memory
+        """
+        return int(self._Memory.transitions_added * self._steps_per_transition) - self._scheduled_steps
+
+
+    def _train(self, steps):
+        """
+        Apply the given number of gradient steps in one compiled loop of the model, then publish its weights,
+        the steps are skipped while the memory is not full enough, as in the serial training
+        """
+        start_time = timeit.default_timer()
+        replays = self._simulation.replay(steps)
+        self._training_time += timeit.default_timer() - start_time
+        self._scheduled_steps += steps
+        self._gradient_steps += replays  # only the replays that ran
+        if replays > 0:
+            self._publish()
+
+
+    def _publish(self):
+        """
+        Copy the weights of the model being trained into the acting model, all at once between two predictions of the acting model
+        """
+        self._ActingModel.set_weights(self._Model.get_weights())
+        self._publications += 1
+
+
+    def report(self):
+        """
+        Throughput of the learner since the last report: gradient steps, gradient steps per second of training, share of the time spent training
+        and weight publications so far
+        """
+        if self._error is not None:
+            raise self._error
+
+        steps, training_time, report_time = self._reported
+        self._reported = (self._gradient_steps, self._training_time, timeit.default_timer())
+        steps = self._reported[0] - steps
+        training_time = self._reported[1] - training_time
+        steps_per_second = steps / training_time if training_time > 0 else 0
+        busy = training_time / (self._reported[2] - report_time)
+        return steps, round(steps_per_second, 1), round(100 * busy, 1), self._publications
+
+
+    def close(self):
+        """
+        Stop the learner thread, then apply the gradient steps still due so that the model is trained on every transition
+        """
+        self._stop.set()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+        if self._due_steps() > 0:
+            self._train(self._due_steps())
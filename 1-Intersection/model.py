@@ -12,6 +12,100 @@ from tensorflow.keras.utils import plot_model
 from tensorflow.keras.models import load_model
 
 
+def compile_predict_one(model, input_dim):
+    """
+    Compile the forward pass of the model for a single state, with a fixed input signature so that it is traced only once
+    """
+    return tf.function(lambda state: model(state, training=False), input_signature=[tf.TensorSpec(shape=(1, input_dim), dtype=tf.float32)])
+
+
+def compile_predict_batch(model, input_dim):
+    """
+    Compile the forward pass of the model for a batch of states, the batch size is left open so that it is traced only once
+    """
+    return tf.function(lambda states: model(states, training=False), input_signature=[tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32)])
+
+
+FIT_BATCH_SIZE = 32  # mini-batch size of the keras fit call that the compiled train step replaces
+
+
+def compile_train_step(model, input_dim, output_dim):
+    """
+    Compile the updates of one keras fit epoch on the given states and updated q-values: shuffled mini-batches, forward pass, MSE loss and Adam update,
+    the loss of every sample is weighted by its importance-sampling weight, all 1 without prioritized replay
+    """
+    loss_function = losses.MeanSquaredError()
+    model.optimizer.build(model.trainable_variables)  # the optimizer variables are created before the tracing
+
+    def train_step(states, q_sa, weights):
+        indices = tf.random.shuffle(tf.range(tf.shape(states)[0]))
+        for start in tf.range(0, tf.shape(states)[0], FIT_BATCH_SIZE):
+            batch = indices[start:start + FIT_BATCH_SIZE]
+            with tf.GradientTape() as tape:
+                loss = loss_function(tf.gather(q_sa, batch), model(tf.gather(states, batch), training=True), sample_weight=tf.gather(weights, batch))
+            gradients = tape.gradient(loss, model.trainable_variables)
+            model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+
+    return tf.function(train_step, input_signature=[
+        tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, output_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32)
+    ])
+
+
+def compile_replays(model, train_step, input_dim, output_dim):
+    """
+    Compile the replays of a whole training session in one loop: for each batch the q-values are predicted with the current weights,
+    the value of the action of every sample is updated with its reward and the best value of its next state, then the train step is applied,
+    returns the td errors of the samples of every batch, for the priorities of the memory
+    """
+    def replays(states, actions, rewards, next_states, weights, gamma):
+        td_errors = tf.TensorArray(tf.float32, size=tf.shape(states)[0])
+        for i in tf.range(tf.shape(states)[0]):
+            q_s_a = model(states[i], training=False)
+            q_s_a_d = model(next_states[i], training=False)
+            targets = rewards[i] + gamma * tf.reduce_max(q_s_a_d, axis=1)
+            td_errors = td_errors.write(i, targets - tf.gather(q_s_a, actions[i], batch_dims=1))
+            train_step(states[i], tf.where(tf.one_hot(actions[i], output_dim) > 0, targets[:, None], q_s_a), weights[i])
+        return td_errors.stack()
+
+    return tf.function(replays, input_signature=[
+        tf.TensorSpec(shape=(None, None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.int32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.float32)
+    ])
+
+
+def export_dense_weights(model, file_path):
+    """
+    Save the kernel, bias and activation of every Dense layer of the model in a .npz file, with float32 weights, for the numpy model
+    """
+    weights = {}
+    dense_layers = [layer for layer in model.layers if isinstance(layer, layers.Dense)]
+    for i, layer in enumerate(dense_layers):
+        kernel, bias = layer.get_weights()
+        weights['kernel_' + str(i)] = kernel.astype(np.float32)
+        weights['bias_' + str(i)] = bias.astype(np.float32)
+        weights['activation_' + str(i)] = np.array(layer.get_config()['activation'])
+    np.savez(file_path, **weights)
+
+
+def export_tflite(model, file_path, calibration_states):
+    """
+    Convert the model to a TFLite model of single states, with post-training int8 quantization of its weights and activations
+    calibrated on the given states, the input and output stay float
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)  # the interpreter allocates its input of a single state by default
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: ([state[None, :]] for state in calibration_states.astype(np.float32))
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(file_path, 'wb') as file:
+        file.write(converter.convert())
+
+
 class TrainModel:   
     def __init__(self, num_layers, width, batch_size, learning_rate, input_dim, output_dim):
         self._input_dim = input_dim
@@ -19,6 +113,10 @@ class TrainModel:
         self._batch_size = batch_size
         self._learning_rate = learning_rate
         self._model = self._build_model(num_layers, width)
+        self._predict_one = compile_predict_one(self._model, input_dim)
+        self._predict_batch = compile_predict_batch(self._model, input_dim)
+        self._train_step = compile_train_step(self._model, input_dim, output_dim)
+        self._replays = compile_replays(self._model, self._train_step, input_dim, output_dim)
 
 
     def _build_model(self, num_layers, width):
@@ -40,29 +138,62 @@ class TrainModel:
         """
         Predict the action values from a single state
         """
-        state = np.reshape(state, [1, self._input_dim])
-        return self._model.predict(state)
+        state = np.reshape(state, [1, self._input_dim]).astype(np.float32)
+        return self._predict_one(state).numpy()  # direct call of the compiled model, without the machinery of predict
 
 
     def predict_batch(self, states):
         """
         Predict the action values from a batch of states
         """
-        return self._model.predict(states)
+        return self._predict_batch(np.asarray(states, dtype=np.float32)).numpy()  # without the machinery and the progress bar of predict
+
+
+    def train_batch(self, states, q_sa, weights=None):
+        """
+        Train the nn using the updated q-values, with the compiled train step, the samples are weighted by their importance-sampling weights if given
+        """
+        if weights is None:
+            weights = np.ones(len(states))
+        self._train_step(np.asarray(states, dtype=np.float32), np.asarray(q_sa, dtype=np.float32), np.asarray(weights, dtype=np.float32))
+
+
+    def train_replays(self, states, actions, rewards, next_states, weights, gamma):
+        """
+        Train the nn on a stack of batches of samples in one compiled loop, the q-values of each batch are updated with the weights trained on the previous ones,
+        returns the td errors of the samples
+        """
+        return self._replays(states.astype(np.float32), actions.astype(np.int32), rewards.astype(np.float32), next_states.astype(np.float32),
+                             weights.astype(np.float32), np.float32(gamma)).numpy()
+
+
+    def get_weights(self):
+        """
+        Return the weights of the nn, to be sent to the actor processes
+        """
+        return self._model.get_weights()
 
 
-    def train_batch(self, states, q_sa):
+    def set_weights(self, weights):
         """
-        Train the nn using the updated q-values
+        Replace the weights of the nn with the ones of the learner
         """
-        self._model.fit(states, q_sa, epochs=1, verbose=0)
+        self._model.set_weights(weights)
 
 
     def save_model(self, path):
         """
-        Save the current model in the folder as .keras file
+        Save the current model in the folder as .keras file, and its weights as .npz file for the numpy model
         """
         self._model.save(os.path.join(path, 'trained_model.keras'))
+        export_dense_weights(self._model, os.path.join(path, 'trained_model.npz'))
+
+
+    def export_tflite(self, path, samples):
+        """
+        Save the current model in the folder as int8 TFLite file, calibrated on the states of the given batch of samples of the memory
+        """
+        export_tflite(self._model, os.path.join(path, 'trained_model.tflite'), samples[0])
 
     @property
     def input_dim(self):
@@ -83,6 +214,7 @@ class TestModel:
     def __init__(self, input_dim, model_path):
         self._input_dim = input_dim
         self._model = self._load_my_model(model_path)
+        self._predict_one = compile_predict_one(self._model, input_dim)
 
 
     def _load_my_model(self, model_folder_path):
@@ -98,12 +230,19 @@ class TestModel:
             sys.exit("Model number not found")
 
 
+    def export_weights(self, path):
+        """
+        Save the weights of the loaded model in the folder as .npz file for the numpy model
+        """
+        export_dense_weights(self._model, os.path.join(path, 'trained_model.npz'))
+
+
     def predict_one(self, state):
         """
         Predict the action values from a single state
         """
-        state = np.reshape(state, [1, self._input_dim])
-        return self._model.predict(state)
+        state = np.reshape(state, [1, self._input_dim]).astype(np.float32)
+        return self._predict_one(state).numpy()  # direct call of the compiled model, without the machinery of predict
 
 
     @property
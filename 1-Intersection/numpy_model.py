@@ -0,0 +1,71 @@
+import os
+import sys
+import numpy as np
+
+ACTIVATIONS = ('relu', 'linear')  # the ones used by TrainModel._build_model
+
+
+class NumpyNetwork:
+    def __init__(self, file_path, input_dim):
+        self._layers = self._load_weights(file_path)
+        self._state = np.zeros((1, input_dim), dtype=np.float32)
+        self._activations = [np.zeros((1, kernel.shape[1]), dtype=np.float32) for kernel, _, _ in self._layers]  # preallocated, one row per layer
+
+
+    def _load_weights(self, file_path):
+        """
+        Load the kernel, bias and activation of every Dense layer exported in the .npz file
+        """
+        layers = []
+        with np.load(file_path) as weights:
+            for i in range(len(weights.files) // 3):
+                activation = str(weights['activation_' + str(i)])
+                if activation not in ACTIVATIONS:
+                    sys.exit("activation '" + activation + "' is not supported by the numpy model")
+                layers.append((weights['kernel_' + str(i)], weights['bias_' + str(i)], activation == 'relu'))
+        return layers
+
+
+    def forward(self, state):
+        """
+        Forward pass of a single state, every layer writes into its preallocated activations
+        """
+        self._state[0] = state
+        x = self._state
+        for (kernel, bias, relu), activations in zip(self._layers, self._activations):
+            np.matmul(x, kernel, out=activations)
+            activations += bias
+            if relu:
+                np.maximum(activations, 0, out=activations)
+            x = activations
+        return x.copy()  # the buffer is overwritten by the next state
+
+
+class NumpyTestModel:  # same interface as TestModel, with the weights exported by export_dense_weights and no tensorflow
+    def __init__(self, input_dim, model_path):
+        self._input_dim = input_dim
+        self._network = self._load_my_model(model_path)
+
+
+    def _load_my_model(self, model_folder_path):
+        """
+        Load the weights stored in the folder specified by the model number, if they exist
+        """
+        weights_file_path = os.path.join(model_folder_path, 'trained_model.npz')
+
+        if os.path.isfile(weights_file_path):
+            return NumpyNetwork(weights_file_path, self._input_dim)
+        else:
+            sys.exit("Model weights not found, export them with export_model.py")
+
+
+    def predict_one(self, state):
+        """
+        Predict the action values from a single state
+        """
+        return self._network.forward(state)
+
+
+    @property
+    def input_dim(self):
+        return self._input_dim
@@ -0,0 +1,93 @@
+import numpy as np
+import xml.etree.ElementTree as ET
+import sys
+
+# distance in meters from the traffic light where every cell of a lane ends, the last cell goes up to the lane start
+CELL_BOUNDARIES = [7, 14, 21, 28, 40, 60, 100, 160, 400]
+
+# lane group of every incoming lane, x2TL_3 are the "turn left only" lanes
+LANE_GROUPS = {
+    "W2TL_0": 0, "W2TL_1": 0, "W2TL_2": 0, "W2TL_3": 1,
+    "N2TL_0": 2, "N2TL_1": 2, "N2TL_2": 2, "N2TL_3": 3,
+    "E2TL_0": 4, "E2TL_1": 4, "E2TL_2": 4, "E2TL_3": 5,
+    "S2TL_0": 6, "S2TL_1": 6, "S2TL_2": 6, "S2TL_3": 7,
+}
+
+
+class StateEncoder:
+    def __init__(self, net_file, num_states, lane_groups, cell_boundaries, edge_cell_boundaries=None, lane_length=None):
+        self._num_states = num_states
+        self._cells_per_lane = len(cell_boundaries) + 1
+        self._lane_index = {lane_id: i for i, lane_id in enumerate(lane_groups)}
+        self._lane_end = self._read_lane_lengths(net_file, lane_groups)  # where the cells of every lane stop
+        self._lane_length = self._lane_end if lane_length is None else np.full(len(lane_groups), lane_length, dtype=float)  # distances are measured from it
+        self._lane_offset = np.array([group * self._cells_per_lane for group in lane_groups.values()], dtype=np.intp)
+
+        # one boundary table for the default cells plus one for every edge with its own cells
+        self._tables = [np.array(cell_boundaries, dtype=float)]
+        self._lane_table = np.zeros(len(lane_groups), dtype=np.intp)
+        for edge_id, boundaries in (edge_cell_boundaries or {}).items():
+            self._tables.append(np.array(boundaries, dtype=float))
+            for lane_id, i in self._lane_index.items():
+                if lane_id.rsplit('_', 1)[0] == edge_id:
+                    self._lane_table[i] = len(self._tables) - 1
+
+
+    def _read_lane_lengths(self, net_file, lane_groups):
+        """
+        Read the length of every lane of the state from the network file
+        """
+        lengths = {}
+        for lane in ET.parse(net_file).getroot().iter('lane'):
+            if lane.get('id') in lane_groups:
+                lengths[lane.get('id')] = float(lane.get('length'))
+
+        missing = [lane_id for lane_id in lane_groups if lane_id not in lengths]
+        if missing:
+            sys.exit("Lanes not found in " + net_file + ": " + ", ".join(missing))
+
+        return np.array([lengths[lane_id] for lane_id in lane_groups], dtype=float)
+
+
+    def encode(self, lane_ids, lane_positions):
+        """
+        Map the lane id and lane position of every car into the cell occupancy state
+        """
+        state = np.zeros(self._num_states)
+        rows = np.fromiter((self._lane_index.get(lane_id, -1) for lane_id in lane_ids), dtype=np.intp, count=len(lane_ids))
+        valid = rows >= 0  # cars crossing the intersection or driving away from it are not part of the state
+        rows = rows[valid]
+        distances = self._lane_length[rows] - np.asarray(lane_positions, dtype=float)[valid]  # distance from the traffic light
+
+        cells = np.empty(len(rows), dtype=np.intp)
+        if len(self._tables) == 1:
+            cells[:] = np.searchsorted(self._tables[0], distances, side='right')
+        else:
+            tables = self._lane_table[rows]
+            for table_id, boundaries in enumerate(self._tables):
+                in_table = tables == table_id
+                cells[in_table] = np.searchsorted(boundaries, distances[in_table], side='right')
+
+        state[self._lane_offset[rows] + cells] = 1  # write every car in the state array in the form of "cell occupied"
+        return state
+
+
+    def cells(self):
+        """
+        List every cell of every lane as (lane id, index in the state, start position, end position on the lane)
+        """
+        cells = []
+        for lane_id, i in self._lane_index.items():
+            length = self._lane_length[i]
+            distances = np.concatenate(([0], self._tables[self._lane_table[i]], [length]))  # cell limits measured from the traffic light
+            for cell in range(self._cells_per_lane):
+                start_pos = max(length - distances[cell + 1], 0)
+                end_pos = min(length - distances[cell], self._lane_end[i])  # a lane shorter than the given length has no car in its first cells
+                if end_pos > start_pos:
+                    cells.append((lane_id, int(self._lane_offset[i]) + cell, float(start_pos), float(end_pos)))
+        return cells
+
+
+    @property
+    def num_states(self):
+        return self._num_states
@@ -0,0 +1,103 @@
+import os
+import sys
+import timeit
+import numpy as np
+
+
+def load_interpreter(file_path):
+    """
+    Load a TFLite model with the standalone interpreter if it is installed, as on the deployment targets, otherwise with the one of tensorflow
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+
+    interpreter = Interpreter(model_path=file_path)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+class TFLiteNetwork:
+    def __init__(self, file_path, input_dim):
+        self._interpreter = load_interpreter(file_path)
+        self._input_index = self._interpreter.get_input_details()[0]['index']
+        self._output_index = self._interpreter.get_output_details()[0]['index']
+        self._state = np.zeros((1, input_dim), dtype=np.float32)  # float input and output, quantized inside the model
+
+
+    def forward(self, state):
+        """
+        Forward pass of a single state with the quantized model
+        """
+        self._state[0] = state
+        self._interpreter.set_tensor(self._input_index, self._state)
+        self._interpreter.invoke()
+        return self._interpreter.get_tensor(self._output_index)  # a copy of the output tensor
+
+
+class TFLiteTestModel:  # same interface as TestModel, with the int8 TFLite model exported at the end of the training
+    def __init__(self, input_dim, model_path):
+        self._input_dim = input_dim
+        self._network = self._load_my_model(model_path)
+
+
+    def _load_my_model(self, model_folder_path):
+        """
+        Load the TFLite model stored in the folder specified by the model number, if it exists
+        """
+        tflite_file_path = os.path.join(model_folder_path, 'trained_model.tflite')
+
+        if os.path.isfile(tflite_file_path):
+            return TFLiteNetwork(tflite_file_path, self._input_dim)
+        else:
+            sys.exit("TFLite model not found, it is exported at the end of the training with export_tflite = True")
+
+
+    def predict_one(self, state):
+        """
+        Predict the action values from a single state
+        """
+        return self._network.forward(state)
+
+
+    @property
+    def input_dim(self):
+        return self._input_dim
+
+
+class ComparedModel:  # predicts with the tested model, records the latency of every decision and whether the float model takes the same action
+    def __init__(self, Model, FloatModel):
+        self._Model = Model
+        self._FloatModel = FloatModel
+        self._latencies = []
+        self._agreements = []
+
+
+    def predict_one(self, state, *agent_id):
+        """
+        Predict the action values from a single state with the tested model, then compare its action with the one of the float model
+        """
+        start_time = timeit.default_timer()
+        q_values = self._Model.predict_one(state, *agent_id)
+        self._latencies.append(timeit.default_timer() - start_time)
+        self._agreements.append(np.argmax(q_values) == np.argmax(self._FloatModel.predict_one(state, *agent_id)))
+        return q_values
+
+
+    def report(self):
+        """
+        Lines of the report of the test episode: number of decisions, action agreement with the float model and latency per decision
+        """
+        latencies = np.array(self._latencies) * 1000
+        return [
+            "decisions: %d" % len(self._agreements),
+            "action agreement with the float model: %.2f %%" % (100 * np.mean(self._agreements)),
+            "latency per decision - mean: %.3f ms - p50: %.3f ms - p99: %.3f ms" % (np.mean(latencies), np.percentile(latencies, 50), np.percentile(latencies, 99))
+        ]
+
+
+    @property
+    def input_dim(self):
+        return self._Model.input_dim
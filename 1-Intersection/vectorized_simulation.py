@@ -0,0 +1,147 @@
+import os
+import sys
+import queue
+import random
+import timeit
+import multiprocessing
+import numpy as np
+
+from training_simulation import Simulation
+from rollout import StreamingMemory, build_actor_simulation, last_episode_stats
+
+
+class LockstepSimulation(Simulation):  # Simulation of an environment process, its actions are chosen by the VectorizedSimulation
+    def __init__(self, *args, connection, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._connection = connection
+
+
+    def _choose_action(self, state, epsilon, *agent_id):
+        """
+        Send the state and the samples gathered since the last decision, then wait for the action chosen together with the other environments
+        """
+        self._connection.send(('decide', self._Memory.pop_samples(), state, agent_id))
+        action = self._connection.recv()
+        if action is None:  # baseline modes, no model involved
+            action = super()._choose_action(state, epsilon, *agent_id)
+        return action
+
+
+class PendingSamples(StreamingMemory):  # stands for the Memory in the environment processes, the samples go with the next decision
+    def __init__(self):
+        super().__init__(queue.SimpleQueue())
+
+
+    def pop_samples(self):
+        samples = []
+        while not self._samples_queue.empty():
+            samples.append(self._samples_queue.get())
+        return samples
+
+
+class VectorizedSimulation:
+    def __init__(self, config, Model, Memory):
+        context = multiprocessing.get_context('spawn')  # sumo connections do not survive a fork
+        self._Model = Model
+        self._Memory = Memory
+        self._mode = config['mode']
+        self._num_actions = config['num_actions']
+        self._decisions = 0
+        self._decision_time = 0
+        self._connections = []
+        self._processes = []
+        for env_id in range(config['actors']):
+            connection, env_connection = context.Pipe()
+            process = context.Process(target=_run_environment, args=(env_connection, config, env_id), daemon=True)
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+
+    def run(self, episodes, epsilons):
+        """
+        Simulate the episodes in lockstep, one per environment: every environment is advanced to its next decision, then the actions
+        of all of them are chosen with a single batch prediction, returns the simulation time and the stats of every episode in episode order
+        """
+        start_time = timeit.default_timer()
+        self._decisions = 0  # the throughput is the one of the last round, the first one includes the startup of the environments
+        for connection, episode, epsilon in zip(self._connections, episodes, epsilons):
+            connection.send(('run', episode, epsilon))
+
+        results = [None] * len(episodes)
+        waiting = list(range(len(episodes)))  # environments that are simulating up to their next decision
+        while waiting:
+            requests = []
+            for env_id in waiting:
+                message = self._connections[env_id].recv()
+                for sample in message[1]:
+                    self._Memory.add_sample(*sample)
+                if message[0] == 'decide':
+                    requests.append((env_id, message[2], message[3]))
+                else:  # end of the episode
+                    results[env_id] = message[2:]
+
+            actions = self._choose_actions(requests, epsilons)
+            for (env_id, _, _), action in zip(requests, actions):
+                self._connections[env_id].send(action)
+            waiting = [env_id for env_id, _, _ in requests]
+            self._decisions += len(requests)
+
+        self._decision_time = timeit.default_timer() - start_time
+        return results
+
+
+    def _choose_actions(self, requests, epsilons):
+        """
+        Choose the action of every environment waiting for a decision, according to an epsilon-greedy policy applied to each row of the batch
+        """
+        if self._mode != 0 or not requests:
+            return [None] * len(requests)
+
+        q_values = self._predict_batch(requests)
+        actions = []
+        for (env_id, _, _), q_sa in zip(requests, q_values):
+            if random.random() < epsilons[env_id]:
+                actions.append(random.randint(0, self._num_actions - 1))  # random action
+            else:
+                actions.append(int(np.argmax(q_sa)))  # the best action given the state
+        return actions
+
+
+    def _predict_batch(self, requests):
+        """
+        Predict the action values of the states of all the requests at once
+        """
+        return self._Model.predict_batch(np.array([state for _, state, _ in requests]))
+
+
+    def close(self):
+        """
+        Stop the environment processes, their sumo is closed on exit
+        """
+        for connection in self._connections:
+            connection.send(('close',))
+        for process in self._processes:
+            process.join()
+
+
+    @property
+    def decisions_per_second(self):
+        return round(self._decisions / max(self._decision_time, 1e-9), 1)
+
+
+def _run_environment(connection, config, env_id):
+    """
+    Main loop of an environment process, simulates the episodes requested by the VectorizedSimulation
+    """
+    sys.stdout = open(os.devnull, "w")  # the learner prints the stats of every episode, in order
+    Memory = PendingSamples()
+    simulation = build_actor_simulation(config, env_id, None, Memory, LockstepSimulation, connection=connection)
+
+    while True:
+        message = connection.recv()
+        if message[0] == 'close':
+            break
+        _, episode, epsilon = message
+        simulation_time, _ = simulation.run(episode, epsilon)
+        connection.send(('done', Memory.pop_samples(), simulation_time, last_episode_stats(simulation)))
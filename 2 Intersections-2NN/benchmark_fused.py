@@ -0,0 +1,33 @@
+import timeit
+import numpy as np
+
+from training_simulation import Simulation
+from benchmark_replay import random_memory
+from benchmark_training import training_time
+from utils import import_train_configuration
+
+REPEATS = 100
+
+
+if __name__ == "__main__":
+
+    from model import TrainModel
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    memory = random_memory(config, np.random.default_rng(0))
+    Models = {fused: TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'],
+                                input_dim=config['num_states'], output_dim=config['num_actions'], fused=fused) for fused in (False, True)}
+    Models[True].set_weights(Models[False].get_weights())
+
+    # equivalence of the predictions, with the same weights
+    states1, states2 = (np.random.default_rng(1).random((2, config['batch_size'], config['num_states'])) < 0.1).astype(np.float32)
+    for q, fused_q in zip(Models[False].predict_batch(states1, states2), Models[True].predict_batch(states1, states2)):
+        assert np.allclose(q, fused_q, atol=1e-4)
+
+    for fused, Model in Models.items():
+        Model.predict_batch(states1, states2)  # warmup
+        predict_time = timeit.timeit(lambda: Model.predict_batch(states1, states2), number=REPEATS) / REPEATS
+        simulation = Simulation(Model, memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], config['training_epochs'], 0)
+        train_time = training_time(simulation.train, config['training_epochs'])
+        print("%-9s - predict_batch: %6.2f ms - training per episode (%d replays of %d samples per agent): %.2f s" % (
+            'fused' if fused else 'separate', predict_time * 1000, config['training_epochs'], config['batch_size'], train_time))
@@ -0,0 +1,54 @@
+import timeit
+import numpy as np
+
+from model import TrainModel
+from utils import import_train_configuration
+
+DECISIONS = 500
+WARMUP = 20  # first calls, that build the predict function or trace the compiled one
+
+
+def legacy_predict_one(keras_model, state, input_dim):
+    """
+    Single state prediction of one agent as it was written in TrainModel.predict_one before the compiled path, kept as reference
+    """
+    state = np.reshape(state, [1, input_dim])
+    return keras_model.predict(state, verbose=0)
+
+
+def latencies(predict, states):
+    """
+    Time of every prediction in milliseconds, after the warmup calls
+    """
+    for state in states[:WARMUP]:
+        predict(state)
+
+    times = []
+    for state in states:
+        start_time = timeit.default_timer()
+        predict(state)
+        times.append((timeit.default_timer() - start_time) * 1000)
+    return np.array(times)
+
+
+if __name__ == "__main__":
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    Model = TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'])
+    states = (np.random.default_rng(0).random((DECISIONS, config['num_states'])) < 0.1).astype(float)  # cell occupancy states
+
+    keras_models = {1: Model._model1, 2: Model._model2}
+
+    # equivalence with the original prediction, for both agents
+    for agent_id, keras_model in keras_models.items():
+        for state in states[:50]:
+            assert np.allclose(Model.predict_one(state, agent_id), legacy_predict_one(keras_model, state, config['num_states']), atol=1e-5)
+    print("compiled predict_one matches keras predict on 50 random states of both agents")
+
+    # latency per decision, the agents decide in turn
+    agent_ids = [1 + i % 2 for i in range(DECISIONS)]
+    legacy = latencies(lambda decision: legacy_predict_one(keras_models[decision[1]], decision[0], config['num_states']), list(zip(states, agent_ids)))
+    compiled = latencies(lambda decision: Model.predict_one(*decision), list(zip(states, agent_ids)))
+    for name, times in (('keras predict', legacy), ('compiled', compiled)):
+        print("%-14s p50: %7.3f ms - p99: %7.3f ms" % (name, np.percentile(times, 50), np.percentile(times, 99)))
+    print("p50 speedup: %.1fx" % (np.percentile(legacy, 50) / np.percentile(compiled, 50)))
@@ -0,0 +1,116 @@
+import sys
+import random
+import timeit
+import itertools
+import numpy as np
+
+from memory import Memory, SIZE, ADDED
+from utils import import_train_configuration
+
+CAPACITIES = [50000, 1000000, 10000000]
+INSERTS = 1000  # samples added to the full memory of agent 1, each agent has its own ring in the buffer
+INTERLEAVED_CAPACITY = 10000  # memory filled with interleaved episodes, whose observations do not chain
+ACTORS = 4
+SAMPLES = 1000  # batches drawn from the full memory of agent 1
+
+
+class LegacyMemory:  # Memory as it was written before the preallocated arrays, a list of tuples for each agent, kept as reference
+    def __init__(self, size_max, size_min):
+        self._samples = {1: [], 2: []}
+        self._size_max = size_max
+        self._size_min = size_min
+
+
+    def add_sample(self, sample, agent_id):
+        self._samples[agent_id].append(sample)
+        if len(self._samples[agent_id]) > self._size_max:
+            self._samples[agent_id].pop(0)
+
+
+    def get_samples(self, n, agent_id):
+        if len(self._samples[agent_id]) < self._size_min:
+            return []
+
+        return random.sample(self._samples[agent_id], min(n, len(self._samples[agent_id])))
+
+
+def full_memories(capacity, sample):
+    """
+    Both memories full at the given capacity for agent 1, the list holds the same sample everywhere and the arrays are filled without writing them,
+    so that the largest capacities fit in RAM and take no minutes to fill
+    """
+    legacy = LegacyMemory(capacity, 0)
+    legacy._samples[1] = [sample] * capacity
+
+    memory = Memory(capacity, 0)
+    memory.add_sample(sample, 1)  # allocates the arrays
+    memory._samples._counters[0, [SIZE, ADDED]] = capacity
+    return legacy, memory
+
+
+def sample_bytes(sample):
+    """
+    Bytes taken by a sample in the legacy memory: the tuple, its objects and the pointer of the list
+    """
+    return sys.getsizeof(sample) + sum(sys.getsizeof(value) for value in sample) + 8
+
+
+def buffer_bytes(buffer):
+    """
+    Bytes taken by a sample in the arrays of the replay buffer, two observations for each sample: within an episode each sample adds one,
+    the interleaved episodes of several actors up to two, and its links to the samples of the agents
+    """
+    return (buffer._observations[0].nbytes // buffer._size_max + sum(array.itemsize for array in (buffer._state_positions, buffer._actions, buffer._rewards))
+            + buffer._partners.itemsize * buffer._partners.shape[2])
+
+
+def interleaved_memory(capacity, num_states, rng):
+    """
+    Memory filled with the samples of ACTORS episodes interleaved, as the actor processes and the lockstep environments add them,
+    the state of a sample is rarely the next state of the previous one of its agent
+    """
+    memory = Memory(capacity, 0)
+    states = (rng.random((ACTORS, 2, num_states)) < 0.1).astype(float)
+    for i in range(3 * capacity):
+        for agent_id in (1, 2):
+            next_state = (rng.random(num_states) < 0.1).astype(float)
+            memory.add_sample((states[i % ACTORS, agent_id - 1], 1, -10.0, next_state), agent_id, (i % ACTORS, i))
+            states[i % ACTORS, agent_id - 1] = next_state
+    return memory
+
+
+def legacy_batch(legacy, batch_size):
+    """
+    A batch of agent 1 of the legacy memory as arrays, the way the simulation stacked it before the training
+    """
+    return [np.array(values) for values in zip(*legacy.get_samples(batch_size, 1))]
+
+
+if __name__ == "__main__":
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    rng = np.random.default_rng(0)
+    state = (rng.random(config['num_states']) < 0.1).astype(float)  # binary cell occupancy, in arrays of their own like the states of the simulation
+    next_state = (rng.random(config['num_states']) < 0.1).astype(float)
+    sample = (state, 1, -10.0, next_state)
+    episode = itertools.cycle([sample, (next_state, 1, -10.0, state)])  # each state is the next state of the previous sample, as within an episode
+
+    memory = interleaved_memory(INTERLEAVED_CAPACITY, config['num_states'], rng)
+    assert memory._size_now(1) == memory._size_now(2) == INTERLEAVED_CAPACITY
+    print("interleaved episodes of %d actors: the memory holds %d samples of %d" % (ACTORS, memory._size_now(1), INTERLEAVED_CAPACITY))
+
+    for capacity in CAPACITIES:
+        legacy, memory = full_memories(capacity, sample)
+
+        legacy_insert = timeit.timeit(lambda: legacy.add_sample(next(episode), 1), number=INSERTS) / INSERTS
+        insert = timeit.timeit(lambda: memory.add_sample(next(episode), 1), number=INSERTS) / INSERTS
+        legacy_sample = timeit.timeit(lambda: legacy_batch(legacy, config['batch_size']), number=SAMPLES) / SAMPLES
+        sample_time = timeit.timeit(lambda: memory.get_samples(config['batch_size'], 1), number=SAMPLES) / SAMPLES
+
+        print("capacity %8d - insert: list %10.0f/s, arrays %10.0f/s (%6.1fx) - batch of %d: list %8.0f/s, arrays %8.0f/s (%5.1fx)" % (
+            capacity, 1 / legacy_insert, 1 / insert, legacy_insert / insert, config['batch_size'], 1 / legacy_sample, 1 / sample_time, legacy_sample / sample_time))
+        del legacy, memory
+
+    buffer = full_memories(1, sample)[1]._samples
+    print("bytes per sample - list: %d - arrays: %d - samples in 1 GB: list %d, arrays %d" % (
+        sample_bytes(sample), buffer_bytes(buffer), 2**30 // sample_bytes(sample), 2**30 // buffer_bytes(buffer)))
@@ -0,0 +1,71 @@
+import os
+import timeit
+import shutil
+import resource
+import tempfile
+import itertools
+import multiprocessing
+import numpy as np
+
+from memory import Memory
+from utils import import_train_configuration
+
+CAPACITY = 10000000
+INSERTS = 100000  # samples added to each memory
+READS = 1000  # batches drawn by the reading process
+
+
+def read_batches(path, batch_size, results):
+    """
+    Draw batches from the memory while the main process adds samples to it, as another process reading the memory would
+    """
+    memory = Memory(CAPACITY, 0, path=path, readonly=True)
+    start_time = timeit.default_timer()
+    for _ in range(READS):
+        memory.get_samples(batch_size, 1)
+    results.put((READS / (timeit.default_timer() - start_time), memory._size_now(1)))
+
+
+def insert_rate(memory, episode):
+    return INSERTS / timeit.timeit(lambda: memory.add_sample(next(episode), 1), number=INSERTS)  # the memory of each agent is written the same way
+
+
+if __name__ == "__main__":
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    rng = np.random.default_rng(0)
+    state = (rng.random(config['num_states']) < 0.1).astype(float)  # binary cell occupancy
+    next_state = (rng.random(config['num_states']) < 0.1).astype(float)
+    episode = itertools.cycle([(state, 1, -10.0, next_state), (next_state, 1, -10.0, state)])  # each state is the next state of the previous sample, as within an episode
+    path = os.path.join(tempfile.mkdtemp(), 'replay_memory')
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    memory = Memory(CAPACITY, 0, path=path)
+    mapped_rate = insert_rate(memory, episode)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss  # peak resident memory added by the mapped arrays
+    ram_rate = insert_rate(Memory(CAPACITY, 0), episode)
+    print("capacity %d - insert: RAM %.0f/s, memory-mapped %.0f/s - files: %.0f MB - resident memory added: %.0f MB" % (
+        CAPACITY, ram_rate, mapped_rate, sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names) / 2**20,
+        rss / 1024))
+
+    # the next session resumes the memory as it was
+    memory.flush()
+    start_time = timeit.default_timer()
+    resumed = Memory(CAPACITY, 0, path=path)
+    resume_time = timeit.default_timer() - start_time
+    memory.seed(0)
+    resumed.seed(0)
+    assert all(np.array_equal(a, b) for a, b in zip(memory.get_samples(config['batch_size'], 1), resumed.get_samples(config['batch_size'], 1)))
+    del resumed
+    print("resume of %d samples: %.1f ms" % (memory._size_now(1), resume_time * 1000))
+
+    # another process draws batches while samples are added
+    results = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=read_batches, args=(path, config['batch_size'], results))
+    reader.start()
+    concurrent_rate = insert_rate(memory, episode)
+    read_rate, size_seen = results.get()
+    reader.join()
+    print("while another process draws batches of %d: insert %.0f/s - reads %.0f batches/s - samples seen by the reader: %d" % (
+        config['batch_size'], concurrent_rate, read_rate, size_seen))
+    shutil.rmtree(os.path.dirname(path))
@@ -0,0 +1,119 @@
+import timeit
+import numpy as np
+
+from training_simulation import Simulation
+from memory import Memory
+from utils import import_train_configuration
+
+BATCH_SIZES = [100, 1000, 4096]
+MEMORY_SIZE = 10000
+REPEATS = 10
+
+
+class RecordingModel:  # predicts with the model but keeps the training arrays instead of training, so that the targets can be compared
+    def __init__(self, Model):
+        self._Model = Model
+        self.trained = None
+
+
+    def predict_batch(self, states1, states2):
+        return self._Model.predict_batch(states1, states2)
+
+
+    def train_batch(self, states1, q1_sa, states2, q2_sa, weights1=None, weights2=None):
+        self.trained = (np.array(states1), np.array(q1_sa), np.array(states2), np.array(q2_sa))
+
+
+    @property
+    def batch_size(self):
+        return self._Model.batch_size
+
+
+def legacy_replay(simulation):
+    """
+    Simulation._replay as it was written before the compiled replays, one python loop over the samples of each agent, kept as reference, on the time-aligned samples of both agents
+    """
+    batch = simulation._Memory.get_samples(simulation._Model.batch_size)
+    batch1 = list(zip(*[field[0] for field in batch[:4]]))  # one tuple for each sample, as the list memory returned them
+    batch2 = list(zip(*[field[1] for field in batch[:4]]))
+
+    if len(batch1) > 0:
+        states1 = np.array([val[0] for val in batch1])
+        next_states1 = np.array([val[3] for val in batch1])
+
+        states2 = np.array([val[0] for val in batch2])
+        next_states2 = np.array([val[3] for val in batch2])
+
+        q1_s_a, q2_s_a = simulation._Model.predict_batch(states1, states2)
+        q1_s_a_d, q2_s_a_d = simulation._Model.predict_batch(next_states1, next_states2)
+
+        x1 = np.zeros((len(batch1), simulation._num_states))
+        y1 = np.zeros((len(batch1), simulation._num_actions))
+
+        x2 = np.zeros((len(batch2), simulation._num_states))
+        y2 = np.zeros((len(batch2), simulation._num_actions))
+
+        for i, b in enumerate(batch1):
+            state1, action1, reward1, _ = b[0], b[1], b[2], b[3]
+            current_q1 = q1_s_a[i]
+            current_q1[action1] = reward1 + simulation._gamma * np.amax(q1_s_a_d[i])
+            x1[i] = state1
+            y1[i] = current_q1
+
+        for i, b in enumerate(batch2):
+            state2, action2, reward2, _ = b[0], b[1], b[2], b[3]
+            current_q2 = q2_s_a[i]
+            current_q2[action2] = reward2 + simulation._gamma * np.amax(q2_s_a_d[i])
+            x2[i] = state2
+            y2[i] = current_q2
+
+        simulation._Model.train_batch(x1, y1, x2, y2)
+
+
+def compiled_replay(simulation):
+    """
+    One replay of Simulation.train, through the compiled loops of the model, returns the td errors of the samples of both agents
+    """
+    batch = simulation._Memory.get_samples(simulation._Model.batch_size)
+    return simulation._Model.train_replays([field[0][None] for field in batch[:5]], [field[1][None] for field in batch[:5]], simulation._gamma)  # stacks of one batch
+
+
+def random_memory(config, rng):
+    """
+    Memory filled with random samples of both agents, binary cell occupancy states, both agents decide at every step
+    """
+    memory = Memory(MEMORY_SIZE, 0)
+    for step in range(MEMORY_SIZE):
+        for agent_id in (1, 2):
+            state, next_state = (rng.random((2, config['num_states'])) < 0.1).astype(float)
+            memory.add_sample((state, int(rng.integers(config['num_actions'])), float(rng.integers(-500, 50)), next_state), agent_id, (0, step))
+    return memory
+
+
+if __name__ == "__main__":
+
+    from model import TrainModel
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    memory = random_memory(config, np.random.default_rng(0))
+
+    for batch_size in BATCH_SIZES:
+        Model = TrainModel(config['num_layers'], config['width_layers'], batch_size, config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'])
+
+        # equivalence with the original replay, on the same batch and weights: the td errors of the compiled loops are computed before their train step
+        recording = Simulation(RecordingModel(Model), memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], 0, 0)
+        memory.seed(batch_size)
+        legacy_replay(recording)
+        x1, y1, x2, y2 = recording._Model.trained
+        memory.seed(batch_size)
+        actions = memory.get_samples(batch_size)[1]  # the same batch again, one row for each agent
+        q1, q2 = Model.predict_batch(x1, x2)
+        memory.seed(batch_size)
+        simulation = Simulation(Model, memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], 0, 0)
+        for y, q, agent_actions, td_errors in zip((y1, y2), (q1, q2), actions, compiled_replay(simulation)):
+            assert np.allclose((y - q)[np.arange(len(y)), agent_actions], td_errors, atol=1e-3)
+
+        # time per call, training included
+        legacy_time = timeit.timeit(lambda: legacy_replay(simulation), number=REPEATS) / REPEATS
+        replay_time = timeit.timeit(lambda: compiled_replay(simulation), number=REPEATS) / REPEATS
+        print("batch %5d - original: %8.1f ms - compiled: %8.1f ms - speedup: %.2fx" % (batch_size, legacy_time * 1000, replay_time * 1000, legacy_time / replay_time))
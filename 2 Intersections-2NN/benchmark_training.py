@@ -0,0 +1,49 @@
+import timeit
+import numpy as np
+
+from training_simulation import Simulation
+from benchmark_replay import random_memory
+from utils import import_train_configuration
+
+EPISODES = 3  # after one warmup episode, that builds the fit machinery or traces the compiled loop
+
+
+def legacy_train(simulation, keras_models, epochs):
+    """
+    Training of an episode as it was done before the compiled train step, one keras fit call for each replay of each agent, kept as reference
+    """
+    for _ in range(epochs):
+        batches = {agent_id: simulation._Memory.get_samples(simulation._Model.batch_size, agent_id) for agent_id in (1, 2)}
+        states1, actions1, rewards1, next_states1 = batches[1][:4]  # the weights are all 1 with uniform draws
+        states2, actions2, rewards2, next_states2 = batches[2][:4]
+        q1, q2 = simulation._Model.predict_batch(np.concatenate((states1, next_states1)), np.concatenate((states2, next_states2)))
+        for agent_id, q, states, actions, rewards in ((1, q1, states1, actions1, rewards1), (2, q2, states2, actions2, rewards2)):
+            q_s_a, q_s_a_d = np.split(q, 2)
+            q_s_a[np.arange(len(states)), actions] = rewards + simulation._gamma * np.amax(q_s_a_d, axis=1)
+            keras_models[agent_id].fit(states, q_s_a, epochs=1, verbose=0)
+
+
+def training_time(train, epochs):
+    """
+    Average training time of an episode, after the warmup episode
+    """
+    train(epochs)
+    start_time = timeit.default_timer()
+    for _ in range(EPISODES):
+        train(epochs)
+    return (timeit.default_timer() - start_time) / EPISODES
+
+
+if __name__ == "__main__":
+
+    from model import TrainModel
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    memory = random_memory(config, np.random.default_rng(0))
+    Model = TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'])
+    simulation = Simulation(Model, memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], config['training_epochs'], 0)
+
+    legacy_time = training_time(lambda epochs: legacy_train(simulation, {1: Model._model1, 2: Model._model2}, epochs), config['training_epochs'])
+    compiled_time = training_time(simulation.train, config['training_epochs'])
+    print("training time per episode (%d replays of %d samples per agent) - fit: %.2f s - compiled: %.2f s - speedup: %.1fx" % (
+        config['training_epochs'], config['batch_size'], legacy_time, compiled_time, legacy_time / compiled_time))
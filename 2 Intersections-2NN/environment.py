@@ -0,0 +1,359 @@
+import numpy as np
+import timeit
+import os
+
+from sumo_backend import traci, tc
+from detectors import CellDetectors, WaitingTimeDetectors, write_detector_file, DETECTOR_FILE
+from observation_cache import ObservationCache, cached_observation
+from state_encoder import StateEncoder, LANE_GROUPS1, LANE_GROUPS2, CELL_BOUNDARIES, cell_geometry
+
+# phase codes based on environment.net.xml
+PHASE_NS_GREEN = 0  # action 0 code 00
+PHASE_NS_YELLOW = 1
+PHASE_NSL_GREEN = 2  # action 1 code 01
+PHASE_NSL_YELLOW = 3
+PHASE_EW_GREEN = 4  # action 2 code 10
+PHASE_EW_YELLOW = 5
+PHASE_EWL_GREEN = 6  # action 3 code 11
+PHASE_EWL_YELLOW = 7
+
+CONTEXT_RANGE = 2000  # meters around the traffic light, covers every lane of environment.net.xml
+
+INTERSECTIONS = {1: "TL", 2: "DE"}  # traffic light controlled by each agent
+INCOMING_ROADS = {1: ["E2TL", "N2TL", "W2TL", "S2TL"], 2: ["TL2E", "-E0", "-E3", "-E4"]}  # roads to the traffic light of each agent
+
+
+class Environment:
+    _reward_shares = (0.7, 0.3)  # parts of the reward 4 of an agent that come from its own intersection and from the other one
+
+    def __init__(self, TrafficGen, sumo_cmd, max_steps, green_duration, yellow_duration, num_states, reward, observation, persistent_sumo=False, sumo_label='default', sumo_port=None, road_geometry='legacy'):
+        self._TrafficGen = TrafficGen
+        self._step = 0
+        self._sumo_cmd = sumo_cmd
+        self._max_steps = max_steps
+        self._green_duration = green_duration
+        self._yellow_duration = yellow_duration
+        self._reward_type = reward
+        self._observation = observation
+        self._ObservationCache = ObservationCache()
+        self._persistent_sumo = persistent_sumo
+        self._sumo_label = sumo_label
+        self._sumo_port = sumo_port
+        self._sumo_running = False
+        self._sumo_startup_time = 0
+        self._saved_startup_time = 0
+        edge_cell_boundaries, lane_length = cell_geometry(road_geometry)
+        self._StateEncoders = {
+            1: StateEncoder(os.path.join('intersection', 'environment.net.xml'), num_states, LANE_GROUPS1, CELL_BOUNDARIES, edge_cell_boundaries, lane_length),
+            2: StateEncoder(os.path.join('intersection', 'environment.net.xml'), num_states, LANE_GROUPS2, CELL_BOUNDARIES, edge_cell_boundaries, lane_length)
+        }
+        self._WaitingTimeDetectors = WaitingTimeDetectors(os.path.join('intersection', 'environment.net.xml'), [INCOMING_ROADS[1], INCOMING_ROADS[2]], 'wait')
+        detector_sets = [self._WaitingTimeDetectors]
+
+        if observation == 'detector':  # lane area detectors loaded by sumo together with the network
+            self._CellDetectors = {agent_id: CellDetectors(StateEncoder, 'cell' + str(agent_id)) for agent_id, StateEncoder in self._StateEncoders.items()}
+            detector_sets.extend(self._CellDetectors.values())
+
+        detector_file = os.path.join('intersection', DETECTOR_FILE)
+        write_detector_file(detector_file, detector_sets)
+        self._sumo_cmd = sumo_cmd + ["--additional-files", detector_file]
+
+
+    def reset(self, seed):
+        """
+        Generate the route file of the episode, set up sumo and return the first state of both intersections, by agent
+        """
+        self._TrafficGen.generate_routefile(seed=seed)
+        self._start_sumo()
+
+        self._step = 0
+        self._ObservationCache.reset()
+        self._old_total_waits = (0, 0)
+        self._actions = {1: -1, 2: -1}
+        self._times = {1: self._green_duration, 2: self._green_duration}  # both agents decide at the first step
+        self._yellows = {1: False, 2: False}
+        return self._observe()
+
+
+    def step(self, actions):
+        """
+        Activate the light phases of the actions of the agents that decided, through the yellow phase when they change, and simulate
+        2 steps at a time up to the next decision of any agent, returns the next state of the agents that decide then, the rewards of both agents,
+        whether the episode is over and the queue lengths of both intersections at every simulated step
+        """
+        info = {'queue_lengths': [], 'iterations': 0}
+        old_action1 = self._actions[1]
+
+        # if the chosen phase is different from the last, activate the yellow phase and restart the timer of the intersection
+        for agent_id, action in actions.items():
+            self._times[agent_id] = 0
+            if self._actions[agent_id] != action:
+                self._set_yellow_phase(old_action1, INTERSECTIONS[agent_id])  # the old phase of TL for both intersections, as in the original loop
+                self._yellows[agent_id] = True
+            self._actions[agent_id] = action
+
+        while True:
+            # after the yellow light has finished, implement the triggering action
+            for agent_id in (1, 2):
+                if self._yellows[agent_id] and self._times[agent_id] >= self._yellow_duration:
+                    self._set_green_phase(self._actions[agent_id], INTERSECTIONS[agent_id])
+                    self._times[agent_id] = 0
+                    self._yellows[agent_id] = False
+
+            # update timers and advance 2 steps in the simulation
+            self._times[1] += 2
+            self._times[2] += 2
+            self._simulate(2, info)
+            info['iterations'] += 1
+
+            if self._step >= self._max_steps:  # nothing left to decide, the last actions are not rewarded
+                info['step'] = self._step
+                if not self._persistent_sumo:  # otherwise the next episode is loaded in the same sumo process
+                    self.close()
+                return {}, None, True, info
+
+            if any(self._due(agent_id) for agent_id in (1, 2)):
+                info['step'] = self._step
+                states = self._observe()
+                return states, self._rewards, False, info
+
+
+    def _due(self, agent_id):
+        """
+        Whether the green phase of the agent has lasted long enough for a new decision
+        """
+        return self._times[agent_id] >= self._green_duration and not self._yellows[agent_id]
+
+
+    def _observe(self):
+        """
+        Retrieve the state of the intersections of the agents that decide now and compute the rewards of the previous actions of both agents
+        """
+        states = {agent_id: self._get_state(agent_id) for agent_id in (1, 2) if self._due(agent_id)}
+        self._rewards = self._calculate_reward(self._old_total_waits[0], self._old_total_waits[1], self._actions[1], self._actions[2])
+        return states
+
+
+    def _start_sumo(self):
+        """
+        Start sumo, or load the new episode in the sumo process kept alive from the previous one
+        """
+        start_time = timeit.default_timer()
+        if self._sumo_running:
+            traci.load(self._sumo_cmd[1:])  # same options without the binary, sumo reads the new route file
+            self._saved_startup_time = round(self._sumo_startup_time - (timeit.default_timer() - start_time), 2)
+        else:
+            traci.start(self._sumo_cmd, port=self._sumo_port, label=self._sumo_label)
+            self._sumo_running = True
+            self._sumo_startup_time = timeit.default_timer() - start_time
+
+        self._WaitingTimeDetectors.reset()
+        for detector_id in self._WaitingTimeDetectors.detector_ids:  # sumo drops the subscriptions when it loads an episode
+            traci.multientryexit.subscribe(detector_id, [tc.LAST_STEP_VEHICLE_ID_LIST])
+
+
+    def close(self):
+        """
+        Close sumo, to be called at the end of the session when sumo is kept alive between the episodes
+        """
+        if self._sumo_running:
+            traci.close()
+            self._sumo_running = False
+
+
+    def _simulate(self, steps_to_do, info):
+        """
+        Execute steps in sumo while gathering the queue lengths of both intersections at every step
+        """
+        while steps_to_do > 0 :
+            self._ObservationCache.step()  # simulate 1 step in sumo, the values read before are outdated
+            self._step += 1 # update the step counter
+            steps_to_do += -1
+            queue_lengths = self._get_queue_length()  # get number of cars for each incoming lane
+            info['queue_lengths'].append(queue_lengths)
+            self._WaitingTimeDetectors.update(queue_lengths, self._get_crossing_waiting_times())
+
+
+    @cached_observation(lambda self, waiting_times: len(waiting_times))
+    def _get_crossing_waiting_times(self):
+        """
+        Retrieve the accumulated waiting time of the cars that crossed into or out of the incoming roads of each intersection in the last step,
+        the detectors are subscribed and only the crossing cars are read
+        """
+        crossings = self._WaitingTimeDetectors.crossings(traci.multientryexit.getAllSubscriptionResults())
+        return [(group, sign, traci.vehicle.getAccumulatedWaitingTime(car_id)) for car_id, group, sign in crossings]
+
+
+    def _collect_waiting_times(self):
+        """
+        Retrieve the accumulated waiting time of every car in the incoming roads of each intersection, followed step by step by the detectors
+        """
+        total_waiting_time1, total_waiting_time2 = self._WaitingTimeDetectors.totals
+        return total_waiting_time1, total_waiting_time2
+
+
+    def _set_yellow_phase(self, old_action, intersection_id):
+        """
+        Activate the correct yellow light combination in sumo for the selected intersection
+        """
+        if old_action>=0 and old_action<=3:
+         yellow_phase_code = old_action * 2 + 1
+         traci.trafficlight.setPhase(intersection_id, yellow_phase_code)
+
+
+    def _set_green_phase(self, action_number, intersection_id):
+        """
+        Activate the correct green light combination in sumo for the selected intersection
+        """
+        if action_number == 0:
+            traci.trafficlight.setPhase(intersection_id, PHASE_NS_GREEN)  # straight
+        elif action_number == 1:
+            traci.trafficlight.setPhase(intersection_id, PHASE_NSL_GREEN) # turn left
+        elif action_number == 2:
+            traci.trafficlight.setPhase(intersection_id, PHASE_EW_GREEN) # straight
+        elif action_number == 3:
+            traci.trafficlight.setPhase(intersection_id, PHASE_EWL_GREEN) # turn left
+
+
+    @cached_observation(8)
+    def _get_queue_length(self):
+        """
+        Retrieve the number of cars with speed = 0 in every incoming lane of both intersections
+        """
+        # incoming cars intersection 1
+        halt_N1 = traci.edge.getLastStepHaltingNumber("N2TL")
+        halt_S1 = traci.edge.getLastStepHaltingNumber("S2TL")
+        halt_E1 = traci.edge.getLastStepHaltingNumber("E2TL")
+        halt_W1 = traci.edge.getLastStepHaltingNumber("W2TL")
+        # incoming cars intersection 2
+        halt_N2 = traci.edge.getLastStepHaltingNumber("-E3")
+        halt_S2 = traci.edge.getLastStepHaltingNumber("-E4")
+        halt_E2 = traci.edge.getLastStepHaltingNumber("-E0")
+        halt_W2 = traci.edge.getLastStepHaltingNumber("TL2E")
+
+        queue_length1 = halt_N1 + halt_S1 + halt_E1 + halt_W1
+        queue_length2 = halt_N2 + halt_S2 + halt_E2 + halt_W2
+
+        return queue_length1, queue_length2
+
+
+    @cached_observation(lambda self, positions: 3 if self._observation == 'subscription' else 4 + 2 * len(positions[0]))
+    def _get_vehicle_positions(self, roads):
+        """
+        Retrieve the lane id and the lane position of every car in the given roads, or in the whole network with subscriptions
+        """
+        if self._observation == 'subscription':  # one bulk response for every car in the network
+            traci.junction.subscribeContext("TL", tc.CMD_GET_VEHICLE_VARIABLE, CONTEXT_RANGE, [tc.VAR_LANE_ID, tc.VAR_LANEPOSITION])
+            results = traci.junction.getContextSubscriptionResults("TL")
+            traci.junction.unsubscribeContext("TL", tc.CMD_GET_VEHICLE_VARIABLE, CONTEXT_RANGE)
+            return [values[tc.VAR_LANE_ID] for values in results.values()], [values[tc.VAR_LANEPOSITION] for values in results.values()]
+
+        car_list=[]
+        for road_id in roads:
+              car_list =np.append(car_list, traci.edge.getLastStepVehicleIDs(road_id))
+        return [traci.vehicle.getLaneID(car_id) for car_id in car_list], [traci.vehicle.getLanePosition(car_id) for car_id in car_list]
+
+
+    @cached_observation(3)
+    def _get_detector_results(self):
+        """
+        Retrieve the number of cars on every lane area detector in one bulk response
+        """
+        traci.junction.subscribeContext("TL", tc.CMD_GET_LANEAREA_VARIABLE, CONTEXT_RANGE, [tc.LAST_STEP_VEHICLE_NUMBER])
+        results = traci.junction.getContextSubscriptionResults("TL")
+        traci.junction.unsubscribeContext("TL", tc.CMD_GET_LANEAREA_VARIABLE, CONTEXT_RANGE)
+        return results
+
+
+    def _get_state(self, agent_id):
+        """
+        Retrieve the state of the intersection of the given agent from sumo, in the form of cell occupancy
+        """
+        # selecting the lanes of the given intersection and agent
+        if agent_id == 1:
+            lanes = ["E2TL", "N2TL", "W2TL", "S2TL"]
+        if agent_id == 2:
+           lanes = ["TL2E","-E0","-E3","-E4"]
+
+        if self._observation == 'detector':
+            return self._CellDetectors[agent_id].get_state(self._get_detector_results())
+
+        lane_ids, lane_positions = self._get_vehicle_positions(lanes)
+        return self._StateEncoders[agent_id].encode(lane_ids, lane_positions)
+
+
+    def _calculate_reward(self,old_total_wait1, old_total_wait2,action1,action2):
+        """
+        Computes the chosen reward of both agents, by agent
+        """
+        current_total_wait1, current_total_wait2 = self._collect_waiting_times()
+        self._old_total_waits = (current_total_wait1, current_total_wait2)
+
+        # boolean parameter to choose reward
+        if self._reward_type == 0:
+            r1 = old_total_wait1 - current_total_wait1
+            r2 = old_total_wait2 - current_total_wait2
+
+        elif self._reward_type == 1:
+            r1 = -current_total_wait1
+            r2 = -current_total_wait2
+
+        elif self._reward_type == 2:
+            rold1 =  old_total_wait1 - current_total_wait1
+            rold2 = old_total_wait2 - current_total_wait2
+            bonus1, bonus2 = self._coordination_bonus(action1, action2, rold1, rold2, 1)
+            r1 = rold1 + bonus1
+            r2 = rold2 + bonus2
+
+        elif self._reward_type == 3:
+            rold1 =  old_total_wait1 - current_total_wait1
+            rold2 = old_total_wait2 - current_total_wait2
+            bonus1, bonus2 = self._coordination_bonus(action1, action2, rold1, rold2, 2)
+            r1 = rold1 + bonus1
+            r2 = rold2 + bonus2
+
+        elif self._reward_type == 4:
+            r1old = old_total_wait1 - current_total_wait1
+            r2old = old_total_wait2 - current_total_wait2
+            r1=self._reward_shares[0]*r1old+self._reward_shares[1]*r2old
+            r2=self._reward_shares[0]*r2old+self._reward_shares[1]*r1old
+        else:
+            print("Reward still to be defined")
+
+        return {1: r1, 2: r2}
+
+
+    def _coordination_bonus(self, action1, action2, rold1, rold2, type):
+        """
+        Assigns a prize when light are synchronised
+        """
+        bonus1 = 0
+        bonus2 = 0
+
+        if type == 1 : # perpendicular
+            if (action1 == 0 and action2 == 2) or (action1 == 2 and action2 == 0):
+                bonus1 = -0.25*rold1
+                bonus2 = -0.25*rold2
+        elif type == 2 :   # parallel
+            if (action1 == 0 and action2 == 0) or (action1 == 2 and action2 == 2):
+                bonus1 = -0.25*rold1
+                bonus2 = -0.25*rold2
+
+        return bonus1, bonus2
+
+
+    def summary(self):
+        """
+        TraCI calls of the last episode, sent and saved by the observation cache
+        """
+        return self._ObservationCache.summary()
+
+
+    @property
+    def rewards(self):
+        return self._rewards  # of the last states returned, after reset there are no actions to reward yet
+
+
+    @property
+    def saved_startup_time(self):
+        return self._saved_startup_time
@@ -3,10 +3,11 @@ import math
 from memory import Memory
 
 class TrafficGenerator:
-    def __init__(self,Memory, max_steps, n_cars_generated):
+    def __init__(self,Memory, max_steps, n_cars_generated, route_file="intersection/episode_routes.rou.xml"):
         self._Memory = Memory
         self._n_cars_generated = n_cars_generated  # how many cars per episode
         self._max_steps = max_steps
+        self._route_file = route_file  # read by sumo through the .sumocfg, or through --route-files for the actor processes
         self._distribution_store=[]
 
     def generate_routefile(self, seed):
@@ -31,7 +32,7 @@ class TrafficGenerator:
         self._distribution_store=(car_gen_steps.tolist())
 
         # produce the file for cars generation, one car per line
-        with open("intersection/episode_routes.rou.xml", "w") as routes:
+        with open(self._route_file, "w") as routes:
             print("""<routes>
             <vType accel="1.0" decel="4.5" id="standard_car" length="5.0" minGap="2.5" maxSpeed="25" sigma="0.5" />
 
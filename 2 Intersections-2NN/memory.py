@@ -1,49 +1,435 @@
-import random
+import os
+import sys
+import numpy as np
+
+PRIORITY_EPSILON = 0.01  # added to the absolute td errors, so that no transition gets a zero probability
+JOINT_DRAWS = 10  # draws of a joint batch at most, the anchors whose transitions of the other agents are missing are replaced by new ones
+LIVE_EPISODES = 64  # episodes whose transitions can still be aligned, more than the episodes simulated at the same time
+FIRST, SIZE, OBSERVATION, NUM_STATES, ADDED = range(5)  # counters of each agent: oldest transition, number of transitions, last observation, size of the states, transitions ever added
+
+
+class SumTree:  # binary tree in an array, the leaves hold the priorities of the transitions and every node the sum of its two children
+    def __init__(self, size, array=np.zeros):
+        self._leaves = 1 << max(size - 1, 0).bit_length()  # a power of two, node i has the children 2i and 2i+1, the root is node 1
+        self._depth = self._leaves.bit_length() - 1
+        self._nodes = array(2 * self._leaves)  # float64, in RAM or memory-mapped
+
+
+    def set(self, position, priority):
+        """
+        Set the priority of one leaf and update the sums up to the root, O(log n)
+        """
+        node = position + self._leaves
+        self._nodes[node] = priority
+        for _ in range(self._depth):
+            node //= 2
+            self._nodes[node] = self._nodes[2 * node] + self._nodes[2 * node + 1]
+
+
+    def update(self, positions, priorities):
+        """
+        Set the priorities of a batch of leaves and update the sums level by level up to the root, O(log n) for each leaf
+        """
+        nodes = np.asarray(positions) + self._leaves
+        self._nodes[nodes] = priorities
+        for _ in range(self._depth):
+            nodes = np.unique(nodes // 2)  # the leaves of a batch share their ancestors
+            self._nodes[nodes] = self._nodes[2 * nodes] + self._nodes[2 * nodes + 1]
+
+
+    def find(self, values, root=1):
+        """
+        Return the leaves where the given values fall in the cumulative sum of the priorities below the root, the whole tree by default,
+        descending the tree for all of them at once, O(log n)
+        """
+        nodes = np.full(len(values), root, dtype=np.int64)
+        for _ in range(self._depth - (root.bit_length() - 1)):
+            left = 2 * nodes
+            right = (values >= self._nodes[left]) & (self._nodes[left + 1] > 0)  # never towards an empty subtree because of rounding
+            values = np.where(right, values - self._nodes[left], values)
+            nodes = np.where(right, left + 1, left)
+        return nodes - self._leaves
+
+
+    def get(self, positions):
+        return self._nodes[positions + self._leaves]
+
+
+    def max(self):
+        return self._nodes[self._leaves:].max()
+
+
+    def sum(self, root=1):
+        return self._nodes[root]
+
+
+    @property
+    def total(self):
+        return self._nodes[1]
+
+
+class MultiAgentReplayBuffer:  # the transitions of every agent in a ring of its own, in preallocated arrays with the agents along the first axis
+    replacement = False  # a transition appears at most once in a batch, as with random.sample
+
+    def __init__(self, num_agents, size_max, path=None, readonly=False):
+        self._num_agents = num_agents
+        self._size_max = size_max
+        self._path = path  # folder of the memory-mapped files of the arrays, that outlive the session, None keeps the arrays in RAM
+        self._readonly = readonly  # e.g. another process reading the buffer while the training writes it
+        self._mapped_arrays = []
+        if path is not None and not readonly:
+            os.makedirs(path, exist_ok=True)
+
+        self._counters = self._array('counters', (num_agents, 5), np.int64)  # in the files with the arrays
+        if self._counters[0, NUM_STATES] == 0 and not readonly:  # a new buffer
+            self._counters[:, OBSERVATION] = -1
+        self._observations_max = 2 * size_max  # within an episode the next state of a transition is the state of the following one, the episodes of several actors interleave and take up to two each
+        self._observations = None  # allocated with the first sample, that gives the size of the states
+        self._last_observations = [None] * num_agents  # packed bytes of the last observation of each agent, compared with the state of its next sample
+        if self._counters[0, NUM_STATES] > 0:  # a buffer of a previous session
+            self._allocate(int(self._counters[0, NUM_STATES]))
+            self._last_observations = [self._observations[agent, position].tobytes() if position >= 0 else None for agent, position in enumerate(self._counters[:, OBSERVATION])]
+        self._state_positions = self._array('state_positions', (num_agents, size_max), np.int32)  # observation of the state of each transition, its next state is the following observation
+        self._actions = self._array('actions', (num_agents, size_max), np.int32)
+        self._rewards = self._array('rewards', (num_agents, size_max), np.float32)
+        self._partners = self._array('partners', (num_agents, size_max, num_agents), np.int64)  # transition of every agent in progress at the end of each transition, as its count of added transitions + 1, 0 while unknown
+        self._episodes = {}  # last transition of every agent and transitions waiting for the next one of every agent, by episode
+        self._rng = np.random.default_rng()
+
+
+    def _array(self, name, shape, dtype):
+        """
+        Return an array of zeros of the buffer, or with a path its memory-mapped .npy file, created if it does not exist yet:
+        the operating system pages it in and out, the whole buffer is never loaded in RAM
+        """
+        if self._path is None:
+            return np.zeros(shape, dtype=dtype)
+
+        file_path = os.path.join(self._path, name + '.npy')
+        if os.path.isfile(file_path):
+            array = np.load(file_path, mmap_mode='r' if self._readonly else 'r+')
+            if array.shape != shape or array.dtype != dtype:
+                sys.exit('The replay memory in ' + self._path + ' does not match memory_size_max and the settings of the memory')
+        elif self._readonly:
+            sys.exit('The replay memory to read does not exist in ' + self._path)
+        else:
+            array = np.lib.format.open_memmap(file_path, mode='w+', dtype=dtype, shape=shape)
+        self._mapped_arrays.append(array)
+        return array
+
+
+    def _allocate(self, num_states):
+        """
+        Allocate the array of the observations, the cell occupancy is 0 or 1 so they are stored packed, 8 cells in each byte
+        """
+        self._observations = self._array('observations', (self._num_agents, self._observations_max, (num_states + 7) // 8), np.uint8)
+
+
+    def add(self, sample, agent, time=None):
+        """
+        Write the sample (state, action, reward, next state) of the agent over its oldest one if its ring is full, in constant time,
+        the state is written only at the start of an episode, otherwise it is the next state of the previous sample of the agent.
+        With the time (episode, step) of its end, the sample is aligned with the transitions of the other agents
+        """
+        state, action, reward, next_state = sample
+        if self._observations is None:
+            self._allocate(len(state))
+            self._counters[:, NUM_STATES] = len(state)  # once the array exists, for the processes reading the buffer
+
+        packed_state = np.packbits(np.asarray(state, dtype=np.uint8))
+        if packed_state.tobytes() != self._last_observations[agent]:  # a new episode
+            self._add_observation(agent, packed_state)
+        state_position = self._counters[agent, OBSERVATION]
+        self._add_observation(agent, np.packbits(np.asarray(next_state, dtype=np.uint8)))
+
+        if self._counters[agent, SIZE] == self._size_max:
+            self._remove_oldest(agent)
+        added = int(self._counters[agent, ADDED])
+        position = added % self._size_max  # every transition is written right after the previous one of the agent
+        self._state_positions[agent, position] = state_position
+        self._actions[agent, position] = action
+        self._rewards[agent, position] = reward
+        self._partners[agent, position] = 0
+        self._partners[agent, position, agent] = added + 1
+        self._counters[agent, SIZE] += 1
+        self._counters[agent, ADDED] += 1
+        if time is not None:
+            self._align(agent, added, time)
+        return position
+
+
+    def _add_observation(self, agent, packed_observation):
+        """
+        Write the observation of the agent over its oldest one, the transition whose state it was is removed with it
+        """
+        position = (self._counters[agent, OBSERVATION] + 1) % self._observations_max
+        self._counters[agent, OBSERVATION] = position
+        if self._counters[agent, SIZE] > 0 and self._state_positions[agent, self._counters[agent, FIRST]] == position:  # only the oldest transition can point to the oldest observation
+            self._remove_oldest(agent)
+        self._observations[agent, position] = packed_observation
+        self._last_observations[agent] = packed_observation.tobytes()
+
+
+    def _remove_oldest(self, agent):
+        self._counters[agent, FIRST] = (self._counters[agent, FIRST] + 1) % self._size_max
+        self._counters[agent, SIZE] -= 1
+
+
+    def _live(self, agents, added):
+        """
+        Whether the transitions of the agents, given by their count of added transitions, are still in the buffer
+        """
+        return (added >= 0) & (added >= self._counters[agents, ADDED] - self._counters[agents, SIZE])
+
+
+    def _align(self, agent, added, time):
+        """
+        Link the new transition of the agent with the transition of every other agent in progress at its end, in the same episode:
+        the last one of the other agent if it ended at the same step, otherwise its next one, linked when it is added
+        """
+        episode, step = time
+        if episode not in self._episodes:
+            self._episodes[episode] = ([None] * self._num_agents, [[] for _ in range(self._num_agents)])
+            if len(self._episodes) > LIVE_EPISODES:
+                del self._episodes[next(iter(self._episodes))]  # the oldest episode, over since long
+        last, waiting = self._episodes[episode]
+
+        for other in range(self._num_agents):
+            if other == agent:
+                continue
+            if last[other] is not None and last[other][0] == step:
+                self._partners[agent, added % self._size_max, other] = last[other][1] + 1
+            else:
+                waiting[other].append((agent, added))
+        for waiting_agent, waiting_added in waiting[agent]:  # the transitions that ended while this one was in progress
+            if self._live(waiting_agent, waiting_added):
+                self._partners[waiting_agent, waiting_added % self._size_max, agent] = added + 1
+        waiting[agent] = []
+        last[agent] = (step, added)
+
+
+    def sample(self, n, agent=None):
+        """
+        Return n random samples of the agent, or all of them if there are less, as one array for each field: states, actions, rewards and next states,
+        followed by their importance-sampling weights, all 1 with uniform draws, and their counts of added transitions for the update of the priorities.
+        Without agent, time-aligned samples of all agents, with the agents along the first axis of every array
+        """
+        if agent is None:
+            return self._joint_sample(n)
+
+        size = int(self._counters[agent, SIZE])
+        indices = (self._counters[agent, FIRST] + self._rng.choice(size, min(n, size), replace=False)) % self._size_max
+        return self._transitions(agent, indices) + (np.ones(len(indices), dtype=np.float32), self._added(agent, indices))
+
+
+    def _draw(self, n, drawn):
+        """
+        Draw n transitions of any agent at random without replacement, none of the given ones drawn before (as agent * size_max + position),
+        returns their agents, their positions and their importance-sampling weights
+        """
+        ends = np.cumsum(self._counters[:, SIZE])
+        draws = self._rng.choice(ends[-1], min(ends[-1], n + len(drawn)), replace=False)  # n of them at least are not drawn yet
+        agents = np.searchsorted(ends, draws, side='right')
+        positions = (self._counters[agents, FIRST] + draws - ends[agents] + self._counters[agents, SIZE]) % self._size_max
+        new = ~np.isin(agents * self._size_max + positions, drawn)
+        agents, positions = agents[new][:n], positions[new][:n]
+        return agents, positions, np.ones(len(agents))
+
+
+    def _joint_sample(self, n):
+        """
+        Draw n transitions of any agent and complete each of them with the transitions of the other agents in progress at its end,
+        gathered for all agents at once. The draws whose other transitions are unknown or removed, or without replacement already in the batch
+        through another draw, are replaced by transitions not drawn yet
+        """
+        n = min(n, self.size())
+        drawn = np.empty(0, dtype=np.int64)  # every transition drawn so far, as agent * size_max + position
+        partners, weights, taken = [], [], set()  # the transitions in the batch, as (agent, count of added transitions)
+        for _ in range(JOINT_DRAWS):
+            agents, positions, draw_weights = self._draw(n, drawn)
+            drawn = np.concatenate((drawn, agents * self._size_max + positions))
+            added = self._partners[agents, positions] - 1  # one column for each agent
+            valid = self._live(np.arange(self._num_agents), added).all(axis=1)
+            for row, weight in zip(added[valid], draw_weights[valid]):
+                transitions = set(enumerate(row.tolist()))
+                if self.replacement or taken.isdisjoint(transitions):
+                    taken |= transitions
+                    partners.append(row)
+                    weights.append(weight)
+            if len(partners) >= n:
+                break
+        if len(partners) == 0:
+            return ()
+
+        added = np.array(partners[:n])
+        weights = np.array(weights[:n])
+        indices = (added % self._size_max).T
+        weights = np.broadcast_to(weights / weights.max(), indices.shape).astype(np.float32)  # of the drawn transition, for the transitions of all agents
+        return self._transitions(np.arange(self._num_agents)[:, None], indices) + (weights, added.T)
+
+
+    def _added(self, agent, indices):
+        """
+        Count of added transitions of the transitions of the agent at the given positions, it identifies them for the update of the priorities:
+        a transition written later in the same position has another count
+        """
+        return self._counters[agent, ADDED] - self._counters[agent, SIZE] + (indices - self._counters[agent, FIRST]) % self._size_max
+
+
+    def _transitions(self, agents, indices):
+        """
+        Read the transitions of the agents at the given positions, one array for each field
+        """
+        if self._observations is None and self._counters[0, NUM_STATES] > 0:  # written meanwhile by the process that adds the samples
+            self._allocate(int(self._counters[0, NUM_STATES]))
+        state_positions = self._state_positions[agents, indices]
+        next_state_positions = (state_positions + 1) % self._observations_max
+        return (self._unpack(self._observations[agents, state_positions]), self._actions[agents, indices], self._rewards[agents, indices],
+                self._unpack(self._observations[agents, next_state_positions]))
+
+
+    def _unpack(self, packed_states):
+        """
+        Unpack the sampled states to the float cell occupancy of the model
+        """
+        return np.unpackbits(packed_states, axis=-1, count=int(self._counters[0, NUM_STATES])).astype(np.float32)
+
+
+    def update_priorities(self, indices, td_errors, agent=None):
+        """
+        Nothing to update with uniform draws
+        """
+        pass
+
+
+    def seed(self, seed):
+        """
+        Seed the draws of the samples, for reproducible batches
+        """
+        self._rng = np.random.default_rng(seed)
+
+
+    def flush(self):
+        """
+        Write the changes of the memory-mapped arrays to their files, e.g. at the end of the session
+        """
+        for array in self._mapped_arrays:
+            array.flush()
+
+
+    def size(self, agent=None):
+        """
+        Number of transitions of the agent, without agent of the agent with the fewest transitions
+        """
+        return int(self._counters[:, SIZE].min() if agent is None else self._counters[agent, SIZE])
+
+
+    @property
+    def num_agents(self):
+        return self._num_agents
+
+
+class PrioritizedMultiAgentReplayBuffer(MultiAgentReplayBuffer):  # draws the transitions with a probability that grows with their last td error, from one sum-tree of all agents
+    replacement = True  # like the samples of one agent, a transition of a high priority can be drawn in several segments
+
+    def __init__(self, num_agents, size_max, alpha, beta, path=None, readonly=False):
+        super().__init__(num_agents, size_max, path, readonly)
+        self._agent_leaves = 1 << max(size_max - 1, 0).bit_length()  # the leaves of each agent are a subtree
+        self._agent_roots = (1 << max(num_agents - 1, 0).bit_length()) + np.arange(num_agents)
+        self._tree = SumTree(num_agents * self._agent_leaves, lambda size: self._array('priorities', (size,), np.float64))
+        self._alpha = alpha  # 0 gives uniform draws
+        self._beta = beta  # 1 corrects completely the bias of the draws in the training
+        self._max_priority = max(1.0, self._tree.max())  # of the new transitions, so that each of them is replayed at least once with a high probability
+
+
+    def add(self, sample, agent, time=None):
+        position = super().add(sample, agent, time)
+        self._tree.set(agent * self._agent_leaves + position, self._max_priority)
+        return position
+
+
+    def _remove_oldest(self, agent):
+        self._tree.set(agent * self._agent_leaves + int(self._counters[agent, FIRST]), 0)
+        super()._remove_oldest(agent)
+
+
+    def sample(self, n, agent=None):
+        """
+        Return n samples drawn in proportion to their priority, one in each of n equal segments of the total priority,
+        with their importance-sampling weights normalized by the largest one: of the agent from its subtree, without agent time-aligned samples of all agents
+        """
+        if agent is None:
+            return self._joint_sample(n)
+
+        root = int(self._agent_roots[agent])
+        size = int(self._counters[agent, SIZE])
+        k = min(n, size)
+        values = (np.arange(k) + self._rng.random(k)) * (self._tree.sum(root) / k)
+        leaves = self._tree.find(values, root)
+        weights = (size * self._tree.get(leaves) / self._tree.sum(root)) ** -self._beta
+        indices = leaves - agent * self._agent_leaves
+        return self._transitions(agent, indices) + ((weights / weights.max()).astype(np.float32), self._added(agent, indices))
+
+
+    def _draw(self, n, drawn):
+        """
+        Draw n transitions of any agent in proportion to their priority, with replacement, returns their agents, their positions and their importance-sampling weights
+        """
+        values = (np.arange(n) + self._rng.random(n)) * (self._tree.total / n)
+        leaves = self._tree.find(values)
+        weights = (self._counters[:, SIZE].sum() * self._tree.get(leaves) / self._tree.total) ** -self._beta
+        return leaves // self._agent_leaves, leaves % self._agent_leaves, weights
+
+
+    def update_priorities(self, indices, td_errors, agent=None):
+        """
+        Set the priorities of the replayed transitions of the agent, or of all agents along the first axis, given by their counts of added transitions,
+        from their new td errors, the ones removed since they were drawn are skipped, also when another transition was written in their position meanwhile
+        """
+        agents = np.arange(self._num_agents)[:, None] if agent is None else agent
+        live = self._live(agents, indices)
+        priorities = (np.abs(td_errors[live]) + PRIORITY_EPSILON) ** self._alpha
+        if len(priorities) > 0:
+            self._tree.update((agents * self._agent_leaves + indices % self._size_max)[live], priorities)
+            self._max_priority = max(self._max_priority, priorities.max())
+
 
 class Memory:  # saves and manages data from simulations
-    def __init__(self, size_max, size_min):
-        self._samples1 = []
-        self._samples2= []
+    def __init__(self, size_max, size_min, prioritized=False, alpha=0.6, beta=0.4, path=None, readonly=False, num_agents=2):
+        # the samples of all agents in one buffer, with a path kept in memory-mapped files, that the next sessions resume and other processes can read
+        self._samples = PrioritizedMultiAgentReplayBuffer(num_agents, size_max, alpha, beta, path, readonly) if prioritized else MultiAgentReplayBuffer(num_agents, size_max, path, readonly)
         self._size_max = size_max
         self._size_min = size_min
 
 
-    def add_sample(self, sample, agent_id):
-      if agent_id == 1:
-         self._samples1.append(sample) 
-         if self._size_now(agent_id) > self._size_max:
-            self._samples1.pop(0)        
-      elif agent_id == 2:
-         self._samples2.append(sample)
-         if self._size_now(agent_id) > self._size_max:
-            self._samples2.pop(0)  
-         
-        # if the length is greater than the size of memory, remove the oldest element
-
-    def get_samples(self, n, agent_id):
-
-        if agent_id == 1:
-         if self._size_now(agent_id) < self._size_min:
-            return []
-
-         if n > self._size_now(agent_id):
-            return random.sample(self._samples1, self._size_now(agent_id))  # get all the samples
-         else:
-            return random.sample(self._samples1, n)  # get "batch size" number of samples
-         
-        if agent_id == 2:
-         if self._size_now(agent_id) < self._size_min:
-            return []
-
-         if n > self._size_now(agent_id):
-            return random.sample(self._samples2, self._size_now(agent_id))  # get all the samples
-         else:
-            return random.sample(self._samples2, n)  # get "batch size" number of samples
-
-    def _size_now(self,agent_id):
-        if agent_id == 1:
-         l= len(self._samples1)
-        if agent_id == 2:
-         l= len(self._samples2)
-
-        return l
\ No newline at end of file
+    def add_sample(self, sample, agent_id, time=None):
+        self._samples.add(sample, agent_id - 1, time)  # if the memory of the agent is full, its oldest element is replaced
+
+
+    def get_samples(self, n, agent_id=None):
+        if self._size_now(agent_id) < self._size_min:
+            return ()
+
+        # get "batch size" number of samples of the agent, or without agent the time-aligned samples of all agents, as ready to use arrays
+        return self._samples.sample(n, None if agent_id is None else agent_id - 1)
+
+
+    def update_priorities(self, indices, td_errors, agent_id=None):
+        self._samples.update_priorities(indices, td_errors, None if agent_id is None else agent_id - 1)  # with the td errors of the replay of the samples
+
+
+    def seed(self, seed):
+        self._samples.seed(seed)
+
+
+    def flush(self):
+        self._samples.flush()
+
+
+    def _size_now(self, agent_id=None):
+        return self._samples.size(None if agent_id is None else agent_id - 1)
+
+
+    @property
+    def num_agents(self):
+        return self._samples.num_agents
@@ -12,17 +12,213 @@ from tensorflow.keras.utils import plot_model
 from tensorflow.keras.models import load_model
 
 
+def compile_predict_one(model, input_dim):
+    """
+    Compile the forward pass of the model for a single state, with a fixed input signature so that it is traced only once
+    """
+    return tf.function(lambda state: model(state, training=False), input_signature=[tf.TensorSpec(shape=(1, input_dim), dtype=tf.float32)])
+
+
+def compile_predict_batch(model, input_dim):
+    """
+    Compile the forward pass of the model for a batch of states, the batch size is left open so that it is traced only once
+    """
+    return tf.function(lambda states: model(states, training=False), input_signature=[tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32)])
+
+
+FIT_BATCH_SIZE = 32  # mini-batch size of the keras fit call that the compiled train step replaces
+
+
+def compile_train_step(model, input_dim, output_dim):
+    """
+    Compile the updates of one keras fit epoch on the given states and updated q-values: shuffled mini-batches, forward pass, MSE loss and Adam update,
+    the loss of every sample is weighted by its importance-sampling weight, all 1 without prioritized replay
+    """
+    loss_function = losses.MeanSquaredError()
+    model.optimizer.build(model.trainable_variables)  # the optimizer variables are created before the tracing
+
+    def train_step(states, q_sa, weights):
+        indices = tf.random.shuffle(tf.range(tf.shape(states)[0]))
+        for start in tf.range(0, tf.shape(states)[0], FIT_BATCH_SIZE):
+            batch = indices[start:start + FIT_BATCH_SIZE]
+            with tf.GradientTape() as tape:
+                loss = loss_function(tf.gather(q_sa, batch), model(tf.gather(states, batch), training=True), sample_weight=tf.gather(weights, batch))
+            gradients = tape.gradient(loss, model.trainable_variables)
+            model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+
+    return tf.function(train_step, input_signature=[
+        tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, output_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32)
+    ])
+
+
+def update_q_values(q_s_a, q_s_a_d, actions, rewards, gamma, output_dim):
+    """
+    Update the value of the action of every sample with its reward and the best value of its next state, the other action values stay the predicted ones,
+    returns the updated q-values and the td errors of the samples
+    """
+    targets = rewards + gamma * tf.reduce_max(q_s_a_d, axis=1)
+    return tf.where(tf.one_hot(actions, output_dim) > 0, targets[:, None], q_s_a), targets - tf.gather(q_s_a, actions, batch_dims=1)
+
+
+def compile_replays(model, train_step, input_dim, output_dim):
+    """
+    Compile the replays of a whole training session in one loop: for each batch the q-values are predicted with the current weights,
+    the value of the action of every sample is updated with its reward and the best value of its next state, then the train step is applied,
+    returns the td errors of the samples of every batch, for the priorities of the memory
+    """
+    def replays(states, actions, rewards, next_states, weights, gamma):
+        td_errors = tf.TensorArray(tf.float32, size=tf.shape(states)[0])
+        for i in tf.range(tf.shape(states)[0]):
+            q_s_a = model(states[i], training=False)
+            q_s_a_d = model(next_states[i], training=False)
+            q_sa, batch_td_errors = update_q_values(q_s_a, q_s_a_d, actions[i], rewards[i], gamma, output_dim)
+            td_errors = td_errors.write(i, batch_td_errors)
+            train_step(states[i], q_sa, weights[i])
+        return td_errors.stack()
+
+    return tf.function(replays, input_signature=[
+        tf.TensorSpec(shape=(None, None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.int32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.float32)
+    ])
+
+
+def build_fused_model(model1, model2, learning_rate):
+    """
+    Group the nn of both agents in one keras graph of two independent towers, that share their layers with model1 and model2,
+    so that a single call predicts or trains both agents
+    """
+    inputs1 = keras.Input(shape=model1.input_shape[1:])
+    inputs2 = keras.Input(shape=model2.input_shape[1:])
+    model = keras.Model(inputs=[inputs1, inputs2], outputs=[model1(inputs1), model2(inputs2)], name='fused_model')
+    model.compile(loss=losses.MeanSquaredError(), optimizer=Adam(learning_rate=learning_rate))  # one Adam for the variables of both towers, whose losses are independent
+    return model
+
+
+def compile_fused_predict_batch(model, input_dim):
+    """
+    Compile the forward pass of the fused model for a batch of states of each agent
+    """
+    return tf.function(lambda states1, states2: model([states1, states2], training=False), input_signature=[
+        tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32)
+    ])
+
+
+def compile_fused_train_step(model, input_dim, output_dim):
+    """
+    Compile the updates of one keras fit epoch of both towers of the fused model at once, on the same number of states of each agent:
+    the sum of the two losses gives each tower the gradients of its own loss, each weighted by the importance-sampling weights of the samples of its agent
+    """
+    loss_function = losses.MeanSquaredError()
+    model.optimizer.build(model.trainable_variables)  # the optimizer variables are created before the tracing
+
+    def train_step(states1, q1_sa, weights1, states2, q2_sa, weights2):
+        indices1 = tf.random.shuffle(tf.range(tf.shape(states1)[0]))
+        indices2 = tf.random.shuffle(tf.range(tf.shape(states2)[0]))
+        for start in tf.range(0, tf.shape(states1)[0], FIT_BATCH_SIZE):
+            batch1 = indices1[start:start + FIT_BATCH_SIZE]
+            batch2 = indices2[start:start + FIT_BATCH_SIZE]
+            with tf.GradientTape() as tape:
+                q1, q2 = model([tf.gather(states1, batch1), tf.gather(states2, batch2)], training=True)
+                loss = loss_function(tf.gather(q1_sa, batch1), q1, sample_weight=tf.gather(weights1, batch1)) + loss_function(tf.gather(q2_sa, batch2), q2, sample_weight=tf.gather(weights2, batch2))
+            gradients = tape.gradient(loss, model.trainable_variables)
+            model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+
+    step_signature = [
+        tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, output_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32)
+    ]
+    return tf.function(train_step, input_signature=step_signature + step_signature)
+
+
+def compile_fused_replays(model, train_step, input_dim, output_dim):
+    """
+    Compile the replays of a whole training session of both agents in one loop, each batch of both agents is predicted and trained with single calls of the fused model,
+    returns the td errors of the samples of every batch of each agent
+    """
+    def replays(states1, actions1, rewards1, next_states1, weights1, states2, actions2, rewards2, next_states2, weights2, gamma):
+        td_errors1 = tf.TensorArray(tf.float32, size=tf.shape(states1)[0])
+        td_errors2 = tf.TensorArray(tf.float32, size=tf.shape(states2)[0])
+        for i in tf.range(tf.shape(states1)[0]):
+            q1_s_a, q2_s_a = model([states1[i], states2[i]], training=False)
+            q1_s_a_d, q2_s_a_d = model([next_states1[i], next_states2[i]], training=False)
+            q1_sa, batch_td_errors1 = update_q_values(q1_s_a, q1_s_a_d, actions1[i], rewards1[i], gamma, output_dim)
+            q2_sa, batch_td_errors2 = update_q_values(q2_s_a, q2_s_a_d, actions2[i], rewards2[i], gamma, output_dim)
+            td_errors1 = td_errors1.write(i, batch_td_errors1)
+            td_errors2 = td_errors2.write(i, batch_td_errors2)
+            train_step(states1[i], q1_sa, weights1[i], states2[i], q2_sa, weights2[i])
+        return td_errors1.stack(), td_errors2.stack()
+
+    replay_signature = [
+        tf.TensorSpec(shape=(None, None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.int32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, None), dtype=tf.float32)
+    ]
+    return tf.function(replays, input_signature=replay_signature + replay_signature + [tf.TensorSpec(shape=(), dtype=tf.float32)])
+
+
+def export_dense_weights(model, file_path):
+    """
+    Save the kernel, bias and activation of every Dense layer of the model in a .npz file, with float32 weights, for the numpy model
+    """
+    weights = {}
+    dense_layers = [layer for layer in model.layers if isinstance(layer, layers.Dense)]
+    for i, layer in enumerate(dense_layers):
+        kernel, bias = layer.get_weights()
+        weights['kernel_' + str(i)] = kernel.astype(np.float32)
+        weights['bias_' + str(i)] = bias.astype(np.float32)
+        weights['activation_' + str(i)] = np.array(layer.get_config()['activation'])
+    np.savez(file_path, **weights)
+
+
+def export_tflite(model, file_path, calibration_states):
+    """
+    Convert the model to a TFLite model of single states, with post-training int8 quantization of its weights and activations
+    calibrated on the given states, the input and output stay float
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)  # the interpreter allocates its input of a single state by default
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: ([state[None, :]] for state in calibration_states.astype(np.float32))
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(file_path, 'wb') as file:
+        file.write(converter.convert())
+
+
 class TrainModel:
-    def __init__(self, num_layers, width, batch_size, learning_rate, input_dim, output_dim):
+    def __init__(self, num_layers, width, batch_size, learning_rate, input_dim, output_dim, fused=False):
         self._input_dim = input_dim
         self._output_dim = output_dim
         self._batch_size = batch_size
         self._learning_rate = learning_rate
-        self._model1 = self._build_model(num_layers, width)
-        self._model2 = self._build_model(num_layers, width)
+        self._model1 = self._build_model(num_layers, width, 'my_model1')  # unique names, both nn are layers of the fused model
+        self._model2 = self._build_model(num_layers, width, 'my_model2')
+        self._predict_one = {1: compile_predict_one(self._model1, input_dim), 2: compile_predict_one(self._model2, input_dim)}  # the agents decide at different steps, one nn each
+        self._fused = fused
 
+        if fused:  # both agents predicted and trained by single calls of one graph, the weights stay the ones of model1 and model2
+            self._fused_model = build_fused_model(self._model1, self._model2, learning_rate)
+            self._predict_batch = compile_fused_predict_batch(self._fused_model, input_dim)
+            self._train_step = compile_fused_train_step(self._fused_model, input_dim, output_dim)
+            self._fused_replays = compile_fused_replays(self._fused_model, self._train_step, input_dim, output_dim)
+        else:
+            self._predict_batches = {1: compile_predict_batch(self._model1, input_dim), 2: compile_predict_batch(self._model2, input_dim)}
+            self._train_steps = {1: compile_train_step(self._model1, input_dim, output_dim), 2: compile_train_step(self._model2, input_dim, output_dim)}
+            self._replays = {
+                1: compile_replays(self._model1, self._train_steps[1], input_dim, output_dim),
+                2: compile_replays(self._model2, self._train_steps[2], input_dim, output_dim)
+            }
 
-    def _build_model(self, num_layers, width):
+
+    def _build_model(self, num_layers, width, name):
         """
         Build and compile a fully connected deep neural network
         """
@@ -32,7 +228,7 @@ class TrainModel:
             x = layers.Dense(width, activation='relu')(x)
         outputs = layers.Dense(self._output_dim, activation='linear')(x)   # Output states
 
-        model = keras.Model(inputs=inputs, outputs=outputs, name='my_model')
+        model = keras.Model(inputs=inputs, outputs=outputs, name=name)
         model.compile(loss=losses.MeanSquaredError(), optimizer=Adam(learning_rate=self._learning_rate))   # Set loss and optimizer 
         return model
     
@@ -41,37 +237,82 @@ class TrainModel:
         """
         Predict the action values from a single state for the corresponding agent
         """
-        state = np.reshape(state, [1, self._input_dim])
-
-        if agent_id == 1:
-          action = self._model1.predict(state)
-        elif agent_id == 2:
-          action = self._model2.predict(state)
-
-        return  action
+        state = np.reshape(state, [1, self._input_dim]).astype(np.float32)
+        return self._predict_one[agent_id](state).numpy()  # direct call of the compiled model, without the machinery of predict
 
 
     def predict_batch(self, states1, states2):
         """
         Predict the action values from a batch of states for both agents
         """
-        return self._model1.predict(states1), self._model2.predict(states2)
+        if self._fused:
+            q1, q2 = self._predict_batch(np.asarray(states1, dtype=np.float32), np.asarray(states2, dtype=np.float32))
+            return q1.numpy(), q2.numpy()
+        return self._predict_batches[1](np.asarray(states1, dtype=np.float32)).numpy(), self._predict_batches[2](np.asarray(states2, dtype=np.float32)).numpy()
 
 
-    def train_batch(self, states1, q1_sa, states2, q2_sa):
+    def train_batch(self, states1, q1_sa, states2, q2_sa, weights1=None, weights2=None):
         """
-        Train the nn using the updated q-values for both agents
+        Train the nn using the updated q-values for both agents, with the compiled train steps, the samples are weighted by their importance-sampling weights if given
         """
-        self._model1.fit(states1, q1_sa, epochs=1, verbose=0)
-        self._model2.fit(states2, q2_sa, epochs=1, verbose=0)
+        if weights1 is None:
+            weights1 = np.ones(len(states1))
+        if weights2 is None:
+            weights2 = np.ones(len(states2))
+        batch1 = (np.asarray(states1, dtype=np.float32), np.asarray(q1_sa, dtype=np.float32), np.asarray(weights1, dtype=np.float32))
+        batch2 = (np.asarray(states2, dtype=np.float32), np.asarray(q2_sa, dtype=np.float32), np.asarray(weights2, dtype=np.float32))
+        if self._fused:  # same number of states for both agents
+            self._train_step(*batch1, *batch2)
+            return
+        self._train_steps[1](*batch1)
+        self._train_steps[2](*batch2)
+
+
+    def train_replays(self, replays1, replays2, gamma):
+        """
+        Train both nn on a stack of batches of samples of each agent (states, actions, rewards, next states, importance-sampling weights) in one compiled loop for each nn,
+        the q-values of each batch are updated with the weights trained on the previous ones, returns the td errors of the samples of each agent
+        """
+        if self._fused:  # a single loop for both nn, on batches of the same size
+            replays = [field.astype(np.int32 if i == 1 else np.float32) for replay in (replays1, replays2) for i, field in enumerate(replay)]
+            td_errors1, td_errors2 = self._fused_replays(*replays, np.float32(gamma))
+            return td_errors1.numpy(), td_errors2.numpy()
+        return tuple(self._replays[agent_id](states.astype(np.float32), actions.astype(np.int32), rewards.astype(np.float32), next_states.astype(np.float32),
+                                             weights.astype(np.float32), np.float32(gamma)).numpy()
+                     for agent_id, (states, actions, rewards, next_states, weights) in ((1, replays1), (2, replays2)))
+
+
+    def get_weights(self):
+        """
+        Return the weights of both nn, to be sent to the actor processes
+        """
+        return self._model1.get_weights(), self._model2.get_weights()
+
+
+    def set_weights(self, weights):
+        """
+        Replace the weights of both nn with the ones of the learner
+        """
+        self._model1.set_weights(weights[0])
+        self._model2.set_weights(weights[1])
 
 
     def save_model(self, path):
         """
-        Save the current models in the folder as .keras file
+        Save the current models in the folder as .keras file, and their weights as .npz file for the numpy model
         """
         self._model1.save(os.path.join(path, 'trained_model1.keras'))
-        self._model2.save(os.path.join(path, 'trained_model2.keras'))       
+        self._model2.save(os.path.join(path, 'trained_model2.keras'))
+        export_dense_weights(self._model1, os.path.join(path, 'trained_model1.npz'))
+        export_dense_weights(self._model2, os.path.join(path, 'trained_model2.npz'))
+
+
+    def export_tflite(self, path, samples1, samples2):
+        """
+        Save the current models in the folder as int8 TFLite files, each calibrated on the states of the given batch of samples of the memory of its agent
+        """
+        export_tflite(self._model1, os.path.join(path, 'trained_model1.tflite'), samples1[0])
+        export_tflite(self._model2, os.path.join(path, 'trained_model2.tflite'), samples2[0])
 
     @property
     def input_dim(self):
@@ -92,6 +333,7 @@ class TestModel:
     def __init__(self, input_dim, model_path):
         self._input_dim = input_dim
         self._model1, self._model2  = self._load_my_model(model_path)
+        self._predict_one = {1: compile_predict_one(self._model1, input_dim), 2: compile_predict_one(self._model2, input_dim)}
 
 
     def _load_my_model(self, model_folder_path):
@@ -110,18 +352,20 @@ class TestModel:
             sys.exit("Model number not found")
 
 
+    def export_weights(self, path):
+        """
+        Save the weights of the loaded models in the folder as .npz file for the numpy model
+        """
+        export_dense_weights(self._model1, os.path.join(path, 'trained_model1.npz'))
+        export_dense_weights(self._model2, os.path.join(path, 'trained_model2.npz'))
+
 
     def predict_one(self, state, agent_id):
         """
         Predict the action values from a single state for the corresponding agent
         """
-        state = np.reshape(state, [1, self._input_dim])
-        if agent_id == 1:
-          action = self._model1.predict(state)
-        elif agent_id == 2:
-          action = self._model2.predict(state)
-
-        return action
+        state = np.reshape(state, [1, self._input_dim]).astype(np.float32)
+        return self._predict_one[agent_id](state).numpy()  # direct call of the compiled model, without the machinery of predict
 
     @property
     def input_dim(self):
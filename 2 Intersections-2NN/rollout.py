@@ -0,0 +1,130 @@
+import os
+import sys
+import queue
+import multiprocessing
+from multiprocessing.util import Finalize
+
+from sumolib.miscutils import getFreeSocketPort
+
+from training_simulation import Simulation
+from environment import Environment
+from generator import TrafficGenerator
+from utils import set_sumo
+
+# state of the actor process, set once by _init_actor
+_simulation = None
+_model = None
+_samples_queue = None
+
+
+class StreamingMemory:  # stands for the Memory in the actor processes, every sample is sent to the learner while simulating
+    def __init__(self, samples_queue):
+        self._samples_queue = samples_queue
+
+
+    def add_sample(self, sample, *agent_id):
+        self._samples_queue.put((sample,) + agent_id)
+
+
+class ParallelRollout:
+    def __init__(self, config, Model, Memory):
+        context = multiprocessing.get_context('spawn')  # sumo connections and tensorflow do not survive a fork
+        self._Model = Model
+        self._Memory = Memory
+        self._mode = config['mode']
+        self._samples_queue = context.Queue()
+        self._pool = context.Pool(config['actors'], _init_actor, (config, self._samples_queue, context.Value('i', 0)))
+
+
+    def run(self, episodes, epsilons):
+        """
+        Simulate the episodes at the same time in the actor processes, each one with its own epsilon and the current weights of the model,
+        the samples go into the memory of the learner while they arrive, returns the simulation time and the stats of every episode in episode order
+        """
+        weights = self._Model.get_weights() if self._mode == 0 else None
+        results = self._pool.starmap_async(_run_episode, [(episode, epsilon, weights) for episode, epsilon in zip(episodes, epsilons)], chunksize=1)
+
+        finished = 0
+        while finished < len(episodes):
+            try:
+                sample = self._samples_queue.get(timeout=1)
+            except queue.Empty:
+                if results.ready() and not results.successful():
+                    results.get()  # raise the error of the actor, its episode will never finish
+                continue
+
+            if sample is None:  # sent by the actor at the end of its episode
+                finished += 1
+            else:
+                self._Memory.add_sample(*sample)
+
+        return results.get()
+
+
+    def close(self):
+        """
+        Stop the actor processes, their sumo is closed on exit
+        """
+        self._pool.close()
+        self._pool.join()
+
+
+def _init_actor(config, samples_queue, actors_started):
+    """
+    Initialize an actor process of the pool, with the model it predicts with and the queue of its samples
+    """
+    global _simulation, _model, _samples_queue
+
+    with actors_started.get_lock():
+        actor_id = actors_started.value
+        actors_started.value += 1
+
+    sys.stdout = open(os.devnull, "w")  # the learner prints the stats of every episode, in order
+
+    if config['mode'] == 0:  # only the model of the training mode is needed, it is only used to predict so the gpu is left to the learner
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+        from model import TrainModel
+        _model = TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'])
+
+    _samples_queue = samples_queue
+    _simulation = build_actor_simulation(config, actor_id, _model, StreamingMemory(samples_queue))
+
+
+def build_actor_simulation(config, actor_id, Model, Memory, SimulationClass=Simulation, **kwargs):
+    """
+    Build the Simulation of an actor process, with its own route file and its own labeled connection to sumo, closed when the process exits
+    """
+    route_file = os.path.abspath(os.path.join('intersection', 'episode_routes_actor' + str(actor_id) + '.rou.xml'))
+    sumo_cmd = set_sumo(False, config['sumocfg_file_name'], config['max_steps']) + ["--route-files", route_file]
+    TrafficGen = TrafficGenerator(Memory, config['max_steps'], config['n_cars_generated'], route_file)
+
+    environment = Environment(TrafficGen, sumo_cmd, config['max_steps'], config['green_duration'], config['yellow_duration'], config['num_states'], config['reward'],
+                              config['observation'], config['persistent_sumo'], sumo_label='actor' + str(actor_id), sumo_port=getFreeSocketPort(),
+                              road_geometry=config['road_geometry'])
+    simulation = SimulationClass(Model, Memory, environment, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'],
+                                 0, config['mode'], **kwargs)  # no training epochs, the learner trains on the samples
+    Finalize(simulation, simulation.close, exitpriority=10)
+    return simulation
+
+
+def last_episode_stats(simulation):
+    """
+    Return the stats of the last episode of the Simulation, by name of the property of each store
+    """
+    stats = {}
+    for name in dir(Simulation):
+        if 'store' in name and isinstance(getattr(Simulation, name), property):
+            stats[name] = getattr(simulation, name)[-1]
+    return stats
+
+
+def _run_episode(episode, epsilon, weights):
+    """
+    Simulate an episode in the actor process, returns the simulation time and the stats of the episode
+    """
+    if weights is not None:
+        _model.set_weights(weights)
+
+    simulation_time, _ = _simulation.run(episode, epsilon)
+    _samples_queue.put(None)  # after every sample of the episode
+    return simulation_time, last_episode_stats(_simulation)
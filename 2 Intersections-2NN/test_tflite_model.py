@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from model import TrainModel
+from tflite_model import TFLiteTestModel
+
+NUM_STATES = 80
+NUM_ACTIONS = 4
+CALIBRATION_STATES = 500
+TEST_STATES = 200
+
+
+def cell_states(n, rng):
+    """
+    Draw n states of occupied and empty cells, as the state encoder gives them
+    """
+    return rng.integers(0, 2, size=(n, NUM_STATES)).astype(np.float32)
+
+
+@pytest.fixture(scope='module')
+def models(tmp_path_factory):
+    """
+    The float models of the two agents and their int8 TFLite exports, calibrated as at the end of the training on a batch of states
+    of the memory of each agent
+    """
+    path = str(tmp_path_factory.mktemp('model'))
+    rng = np.random.default_rng(0)
+    tf.keras.utils.set_random_seed(0)
+    Model = TrainModel(2, 64, 100, 0.001, NUM_STATES, NUM_ACTIONS)
+    Model.export_tflite(path, (cell_states(CALIBRATION_STATES, rng),), (cell_states(CALIBRATION_STATES, rng),))
+    return Model, TFLiteTestModel(NUM_STATES, path)
+
+
+@pytest.mark.parametrize("agent_id", [1, 2])
+def test_tflite_model_follows_the_float_model(models, agent_id):
+    """
+    The quantized action values of each agent stay on average within a few percent of the float ones, and the actions taken are the same
+    """
+    Model, TFLiteModel = models
+    states = cell_states(TEST_STATES, np.random.default_rng(agent_id))
+    float_q = np.array([Model.predict_one(state, agent_id)[0] for state in states])
+    tflite_q = np.array([TFLiteModel.predict_one(state, agent_id)[0] for state in states])
+    assert tflite_q.shape == (TEST_STATES, NUM_ACTIONS) and tflite_q.dtype == np.float32
+    assert np.mean(np.abs(tflite_q - float_q)) <= 0.02 * np.max(np.abs(float_q))
+    assert np.mean(np.argmax(tflite_q, axis=1) == np.argmax(float_q, axis=1)) >= 0.95
+
+
+def test_tflite_models_differ_by_agent(models):
+    """
+    Each agent decides with the export of its own network
+    """
+    Model, TFLiteModel = models
+    state = cell_states(1, np.random.default_rng(3))[0]
+    assert not np.allclose(TFLiteModel.predict_one(state, 1), TFLiteModel.predict_one(state, 2))
+
+
+def test_missing_tflite_models(tmp_path):
+    with pytest.raises(SystemExit):
+        TFLiteTestModel(NUM_STATES, str(tmp_path))
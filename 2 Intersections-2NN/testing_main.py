@@ -2,13 +2,39 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os
+import sys
 from shutil import copyfile
 
-from testing_simulation import Simulation
+from utils import select_backend, import_test_configuration, set_sumo, set_test_path
+
+select_backend('testing_settings.ini')  # before the modules that control sumo are imported
+
+from testing_simulation import Simulation, TestingEnvironment
 from generator import TrafficGenerator
-from model import TestModel
 from visualization import Visualization
-from utils import import_test_configuration, set_sumo, set_test_path
+from decision_cache import DecisionCache
+
+
+def build_model(config, model_path):
+    """
+    Load the model to test with the chosen inference engine, tensorflow is imported only here and only for keras,
+    the tflite model is compared at every decision with the float one of the numpy engine
+    """
+    if config['inference'] == 'numpy':  # forward pass of the weights exported with the model, tensorflow is not imported
+        from numpy_model import NumpyTestModel as TestModel
+    elif config['inference'] == 'keras':
+        from model import TestModel
+    elif config['inference'] == 'tflite':  # int8 model exported at the end of the training with export_tflite = True, with the standalone interpreter when installed
+        from numpy_model import NumpyTestModel
+        from tflite_model import TFLiteTestModel, ComparedModel
+        return ComparedModel(TFLiteTestModel(input_dim=config['num_states'], model_path=model_path), NumpyTestModel(input_dim=config['num_states'], model_path=model_path))
+    else:
+        sys.exit("inference must be keras, numpy or tflite, not '" + config['inference'] + "'")
+
+    return TestModel(
+        input_dim=config['num_states'],
+        model_path=model_path
+    )
 
 
 if __name__ == "__main__":
@@ -18,10 +44,9 @@ if __name__ == "__main__":
     sumo_cmd = set_sumo(config['gui'], config['sumocfg_file_name'], config['max_steps'])
     model_path, plot_path = set_test_path(config['models_path_name'], config['model_to_test'])
 
-    Model = TestModel(
-        input_dim=config['num_states'],
-        model_path=model_path
-    )
+    Model = build_model(config, model_path)
+    if Model is not None and config['decision_cache_size'] > 0:  # the repeated states are answered without the network, the tflite report covers the other ones
+        Model = DecisionCache(Model, config['decision_cache_size'])
 
     TrafficGen = TrafficGenerator(
         Model,
@@ -34,22 +59,39 @@ if __name__ == "__main__":
         dpi=96
     )
         
-    Simulation = Simulation(
-        Model,
+    Environment = TestingEnvironment(
         TrafficGen,
         sumo_cmd,
         config['max_steps'],
         config['green_duration'],
         config['yellow_duration'],
         config['num_states'],
-        config['num_actions'],
-        config['reward']
+        config['reward'],
+        config['observation'],
+        road_geometry=config['road_geometry']
+    )
+
+    Simulation = Simulation(
+        Model,
+        Environment
     )
 
     print('\n----- Test episode')
     simulation_time = Simulation.run(config['episode_seed'])  # run the simulation
     print('Simulation time:', simulation_time, 's')
 
+    if config['inference'] == 'tflite' and Model is not None:  # agreement with the float model and latency of the quantized one
+        with open(os.path.join(plot_path, 'tflite_report.txt'), "w") as file:
+            for line in Model.report():
+                print(line)
+                file.write("%s\n" % line)
+
+    if Model is not None and config['decision_cache_size'] > 0:  # hit rate of the decision cache, saved with the plots
+        with open(os.path.join(plot_path, 'cache_report.txt'), "w") as file:
+            for line in Model.cache_report():
+                print(line)
+                file.write("%s\n" % line)
+
     print("----- Testing info saved at:", plot_path)
 
     copyfile(src='testing_settings.ini', dst=os.path.join(plot_path, 'testing_settings.ini'))
@@ -60,7 +102,7 @@ if __name__ == "__main__":
     Visualization.save_data_and_plot(0,data=Simulation.reward2_episode, filename='reward2', xlabel='Action step', ylabel='Reward 2')
     Visualization.save_data_and_plot(0,data=Simulation.queue2_length_episode, filename='queue2', xlabel='Step', ylabel='Queue length 2 (vehicles)')
     Visualization.save_data_and_plot(0,data=Simulation.queue_total_length_episode, filename='total_queue', xlabel='Step', ylabel=' Total Queue length (vehicles)')
-    Visualization.save_data_and_plot(1,data=Simulation._TrafficGen._distribution_store, filename='distribution', xlabel='Step', ylabel='Num cars (vehicles)')
+    Visualization.save_data_and_plot(1,data=TrafficGen._distribution_store, filename='distribution', xlabel='Step', ylabel='Num cars (vehicles)')
     Visualization.save_data_and_plot(1,data=Simulation.store_action1, filename='action1', xlabel='Episode', ylabel='Action 1')
     Visualization.save_data_and_plot(1,data=Simulation.store_action2, filename='action2', xlabel='Episode', ylabel='Action 2')
 
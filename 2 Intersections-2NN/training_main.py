@@ -2,51 +2,94 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os
+import sys
 import datetime
 from shutil import copyfile
 
+from utils import select_backend, import_train_configuration, set_sumo, set_train_path, set_memory_path
+
+select_backend('training_settings.ini')  # before the modules that control sumo are imported
+
 from training_simulation import Simulation
+from environment import Environment
+from rollout import ParallelRollout
+from learner import AsyncLearner, SharedMemory, SharedModel
+from decision_cache import DecisionCache
+from vectorized_simulation import VectorizedSimulation
 from generator import TrafficGenerator
 from memory import Memory
-from model import TrainModel
 from visualization import Visualization
-from utils import import_train_configuration, set_sumo, set_train_path
 
+CALIBRATION_STATES = 500  # states of the memory sampled to calibrate the quantization of the TFLite export
 
-if __name__ == "__main__":
+
+def build_model(config, report_devices=True):
+    """
+    Build the model of the training mode, tensorflow is imported only here so that the baseline modes never load it
+    """
+    if config['mode'] != 0:  # the baseline modes choose their actions without a model
+        return None
 
     import tensorflow as tf
-    from tensorflow.python.client import device_lib
+    from model import TrainModel
+
+    if not report_devices:  # e.g. the acting model of the async learner, built after the model it acts for
+        return TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'], fused=config['fused_agents'])
 
     # Print the list of local devices
-    print("###################\nNum GPUs Available:", len(tf.config.list_physical_devices('GPU')))
-    print(tf.config.list_physical_devices('GPU'))
+    gpus = tf.config.list_physical_devices('GPU')
+    print("###################\nNum GPUs Available:", len(gpus))
+    print(gpus)
 
     # Ensure that TensorFlow is using the GPU
-    if len(tf.config.list_physical_devices('GPU')) > 0:
+    if len(gpus) > 0:
         print("TensorFlow is using GPU.")
     else:
         print("TensorFlow is NOT using GPU.")
 
-    # initialise parameters and classes
-    config = import_train_configuration(config_file='training_settings.ini')
-    sumo_cmd = set_sumo(config['gui'], config['sumocfg_file_name'], config['max_steps'])
-    path = set_train_path(config['models_path_name'])
-
-    Model = TrainModel(
+    return TrainModel(
         config['num_layers'], 
         config['width_layers'], 
         config['batch_size'], 
         config['learning_rate'], 
         input_dim=config['num_states'], 
-        output_dim=config['num_actions']
+        output_dim=config['num_actions'],
+        fused=config['fused_agents']
     )
 
+
+if __name__ == "__main__":
+
+    # initialise parameters and classes
+    config = import_train_configuration(config_file='training_settings.ini')
+    sumo_cmd = set_sumo(config['gui'], config['sumocfg_file_name'], config['max_steps'])
+    path = set_train_path(config['models_path_name'])
+
+    Model = build_model(config)
+
     Memory = Memory(
         config['memory_size_max'], 
-        config['memory_size_min']
+        config['memory_size_min'],
+        config['prioritized_replay'],
+        config['priority_alpha'],
+        config['priority_beta'],
+        set_memory_path(config['models_path_name'], path, config['resume_memory_from']) if config['persistent_memory'] else None  # memory-mapped, kept with the model
     )
 
+    learning_async = config['async_learner'] and config['mode'] == 0
+    if learning_async and config['actors'] > 1:
+        sys.exit("async_learner needs actors = 1, the actor processes already receive the weights of the learner between their rounds of episodes")
+
+    ActingModel = SharedModel(build_model(config, report_devices=False)) if learning_async else Model  # the model the episodes are simulated with
+    caching = config['mode'] == 0 and config['decision_cache_size'] > 0
+    if caching:  # off by default in training: the cache is emptied every time the weights change, so it pays off in testing only
+        ActingModel = DecisionCache(ActingModel, config['decision_cache_size'])
+        cache_hit_rate_store = []
+
+    if learning_async:  # the learner trains Model in a thread while the episodes are simulated with ActingModel
+        Memory = SharedMemory(Memory)
+        Learner = AsyncLearner(config, Model, ActingModel, Memory)
+
     TrafficGen = TrafficGenerator(
         Memory,
         config['max_steps'], 
@@ -58,34 +101,73 @@ if __name__ == "__main__":
         dpi=96
     )
         
-    Simulation = Simulation(
-        Model,
-        Memory,
+    Environment = Environment(
         TrafficGen,
         sumo_cmd,
-        config['gamma'],
         config['max_steps'],
         config['green_duration'],
         config['yellow_duration'],
         config['num_states'],
+        config['reward'],
+        config['observation'],
+        config['persistent_sumo'],
+        road_geometry=config['road_geometry']
+    )
+
+    Simulation = Simulation(
+        ActingModel,
+        Memory,
+        Environment,
+        config['gamma'],
+        config['max_steps'],
+        config['num_states'],
         config['num_actions'],
-        config['training_epochs'],
-        config['mode'],
-        config['reward']
+        0 if learning_async else config['training_epochs'],
+        config['mode']
     )
     
+    if config['actors'] > 1 and config['lockstep']:  # episodes simulated by the environment processes, the learner chooses their actions in batches
+        Rollout = VectorizedSimulation(config, Model, Memory)
+    elif config['actors'] > 1:  # episodes simulated by the actor processes, the learner trains on their samples
+        Rollout = ParallelRollout(config, Model, Memory)
+
     episode = 0
     timestamp_start = datetime.datetime.now()
     
     while episode < config['total_episodes']:  # training for the specified episodes
 
-        print('\n----- Episode', str(episode+1), 'of', str(config['total_episodes']))
-        epsilon = 1.0 - (episode / config['total_episodes'])  # set the epsilon for this episode according to epsilon-greedy policy
-        simulation_time, training_time = Simulation.run(episode, epsilon)  # run the simulation
-        print('Simulation time:', simulation_time, 's - Training time:', training_time, 's - Total:', round(simulation_time+training_time, 1), 's')
-        episode += 1
-
-        if episode % 10 == 0: # save data for on_fly visualisation
+        previous_episode = episode
+        if config['actors'] > 1:
+            episodes = list(range(episode, min(episode + config['actors'], config['total_episodes'])))
+            print('\n----- Episodes', str(episodes[0]+1), 'to', str(episodes[-1]+1), 'of', str(config['total_episodes']))
+            epsilons = [1.0 - (e / config['total_episodes']) for e in episodes]  # each actor with the epsilon of its own episode
+            results = Rollout.run(episodes, epsilons)  # simulate the episodes at the same time, their samples fill the memory
+            for e, epsilon, (simulation_time, stats) in zip(episodes, epsilons, results):
+                Simulation.add_episode_stats(stats)  # in episode order, as if simulated one after the other
+                print('Episode', str(e+1), '- Epsilon:', round(epsilon, 2), '- Simulation time:', simulation_time, 's')
+            training_time = Simulation.train(len(episodes) * config['training_epochs']) if config['mode'] == 0 else 0  # the same updates as the serial episodes
+            if config['lockstep']:  # throughput of the batched action selection in this round
+                print('Training time:', training_time, 's - Lockstep decisions:', Rollout.decisions_per_second, '/s')
+            else:
+                print('Training time:', training_time, 's')
+            episode += len(episodes)
+        else:
+            print('\n----- Episode', str(episode+1), 'of', str(config['total_episodes']))
+            epsilon = 1.0 - (episode / config['total_episodes'])  # set the epsilon for this episode according to epsilon-greedy policy
+            simulation_time, training_time = Simulation.run(episode, epsilon)  # run the simulation
+            if caching:
+                cache_hit_rate_store.append(ActingModel.hit_rate())
+                print('Decision cache hit rate:', cache_hit_rate_store[-1], '%')
+                ActingModel.reset_stats()
+            if learning_async:  # the training happened while simulating, throughput of both
+                gradient_steps, steps_per_second, busy, publications = Learner.report()
+                print('Simulation:', round(config['max_steps'] / simulation_time, 1), 'steps/s (sumo startup saved:', Simulation.saved_startup_time, 's) - Learner:', gradient_steps, 'gradient steps,',
+                      steps_per_second, 'steps/s, busy', busy, '% of the time - Published weights:', publications)
+            else:
+                print('Simulation time:', simulation_time, 's (sumo startup saved:', Simulation.saved_startup_time, 's) - Training time:', training_time, 's - Total:', round(simulation_time+training_time, 1), 's')
+            episode += 1
+
+        if episode // 10 > previous_episode // 10: # save data for on_fly visualisation
           with open(os.path.join(path, 'plot_'+ 'rewards1_on_fly' + '_data.txt'), "w") as file1:
               for value in Simulation.reward_store1:
                     file1.write("%s\n" % value)
@@ -93,11 +175,23 @@ if __name__ == "__main__":
               for value in Simulation.reward_store2:
                     file2.write("%s\n" % value)
 
+    Simulation.close()
+    if learning_async:
+        Learner.close()
+    if config['actors'] > 1:
+        Rollout.close()
+
     print("\n----- Start time:", timestamp_start)
     print("----- End time:", datetime.datetime.now())
     print("----- Session info saved at:", path)
+    Memory.flush()  # the persistent memory is complete on disk for the next session
 
-    Model.save_model(path)
+    if config['mode'] == 0:  # only if in training mode
+        Model.save_model(path)
+        if config['export_tflite']:
+            samples1, samples2 = Memory.get_samples(CALIBRATION_STATES, 1), Memory.get_samples(CALIBRATION_STATES, 2)
+            if samples1 and samples2:
+                Model.export_tflite(path, samples1, samples2)  # quantized models for the tflite inference of testing, calibrated on the states of the memory
 
     copyfile(src='training_settings.ini', dst=os.path.join(path, 'training_settings.ini'))
 
@@ -109,3 +203,5 @@ if __name__ == "__main__":
     Visualization.save_data_and_plot(0,data=Simulation.avg_queue_length_store2, filename='queue2', xlabel='Episode', ylabel='Average queue length 2 (vehicles)')
     Visualization.save_data_and_plot(0,data=Simulation.avg_queue_length_total_store, filename='total_queue', xlabel='Episode', ylabel='Average total queue length (vehicles)')
     Visualization.save_data_and_plot(0,data=Simulation.reward_store_total, filename='total_reward', xlabel='Episode', ylabel='Cumulative negative total reward')
+    if caching and cache_hit_rate_store:  # the actor processes predict without the cache
+        Visualization.save_data_and_plot(0,data=cache_hit_rate_store, filename='cache_hit_rate', xlabel='Episode', ylabel='Decision cache hit rate (%)')
\ No newline at end of file
@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 import os
 
 class Visualization:
@@ -11,6 +10,8 @@ class Visualization:
         """
         Produce a plot of performance of the agent over the session and save the relative data to txt
         """
+        import matplotlib.pyplot as plt  # imported at the first plot, the simulation does not need it
+
         min_val = min(data)
         max_val = max(data)
 
@@ -0,0 +1,121 @@
+import sys
+import random
+import timeit
+import itertools
+import numpy as np
+
+from memory import Memory
+from utils import import_train_configuration
+
+CAPACITIES = [50000, 1000000, 10000000]
+INSERTS = 1000  # samples added to the full memory
+INTERLEAVED_CAPACITY = 10000  # memory filled with interleaved episodes, whose observations do not chain
+ACTORS = 4
+SAMPLES = 1000  # batches drawn from the full memory
+
+
+class LegacyMemory:  # Memory as it was written before the preallocated arrays, a list of tuples, kept as reference
+    def __init__(self, size_max, size_min):
+        self._samples = []
+        self._size_max = size_max
+        self._size_min = size_min
+
+
+    def add_sample(self, sample):
+        self._samples.append(sample)
+        if self._size_now() > self._size_max:
+            self._samples.pop(0)
+
+
+    def get_samples(self, n):
+        if self._size_now() < self._size_min:
+            return []
+
+        if n > self._size_now():
+            return random.sample(self._samples, self._size_now())
+        else:
+            return random.sample(self._samples, n)
+
+
+    def _size_now(self):
+        return len(self._samples)
+
+
+def full_memories(capacity, sample):
+    """
+    Both memories full at the given capacity, the list holds the same sample everywhere and the arrays are filled without writing them,
+    so that the largest capacities fit in RAM and take no minutes to fill
+    """
+    legacy = LegacyMemory(capacity, 0)
+    legacy._samples = [sample] * capacity
+
+    memory = Memory(capacity, 0)
+    memory.add_sample(sample)  # allocates the arrays
+    memory._samples._size = capacity
+    return legacy, memory
+
+
+def sample_bytes(sample):
+    """
+    Bytes taken by a sample in the legacy memory: the tuple, its objects and the pointer of the list
+    """
+    return sys.getsizeof(sample) + sum(sys.getsizeof(value) for value in sample) + 8
+
+
+def buffer_bytes(buffer):
+    """
+    Bytes taken by a sample in the arrays of the replay buffer, two observations for each sample: within an episode each sample adds one,
+    the interleaved episodes of several actors up to two
+    """
+    return buffer._observations.nbytes // buffer._size_max + sum(array.itemsize for array in (buffer._state_positions, buffer._actions, buffer._rewards))
+
+
+def interleaved_memory(capacity, num_states, rng):
+    """
+    Memory filled with the samples of ACTORS episodes interleaved, as the actor processes and the lockstep environments add them,
+    the state of a sample is rarely the next state of the previous one
+    """
+    memory = Memory(capacity, 0)
+    states = (rng.random((ACTORS, num_states)) < 0.1).astype(float)
+    for i in range(3 * capacity):
+        next_state = (rng.random(num_states) < 0.1).astype(float)
+        memory.add_sample((states[i % ACTORS], 1, -10.0, next_state))
+        states[i % ACTORS] = next_state
+    return memory
+
+
+def legacy_batch(legacy, batch_size):
+    """
+    A batch of the legacy memory as arrays, the way the simulation stacked it before the training
+    """
+    return [np.array(values) for values in zip(*legacy.get_samples(batch_size))]
+
+
+if __name__ == "__main__":
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    rng = np.random.default_rng(0)
+    state = (rng.random(config['num_states']) < 0.1).astype(float)  # binary cell occupancy, in arrays of their own like the states of the simulation
+    next_state = (rng.random(config['num_states']) < 0.1).astype(float)
+    sample = (state, 1, -10.0, next_state)
+    episode = itertools.cycle([sample, (next_state, 1, -10.0, state)])  # each state is the next state of the previous sample, as within an episode
+
+    memory = interleaved_memory(INTERLEAVED_CAPACITY, config['num_states'], rng)
+    assert memory._size_now() == INTERLEAVED_CAPACITY
+    print("interleaved episodes of %d actors: the memory holds %d samples of %d" % (ACTORS, memory._size_now(), INTERLEAVED_CAPACITY))
+
+    for capacity in CAPACITIES:
+        legacy, memory = full_memories(capacity, sample)
+
+        legacy_insert = timeit.timeit(lambda: legacy.add_sample(next(episode)), number=INSERTS) / INSERTS
+        insert = timeit.timeit(lambda: memory.add_sample(next(episode)), number=INSERTS) / INSERTS
+        legacy_sample = timeit.timeit(lambda: legacy_batch(legacy, config['batch_size']), number=SAMPLES) / SAMPLES
+        sample_time = timeit.timeit(lambda: memory.get_samples(config['batch_size']), number=SAMPLES) / SAMPLES
+
+        print("capacity %8d - insert: list %10.0f/s, arrays %10.0f/s (%6.1fx) - batch of %d: list %8.0f/s, arrays %8.0f/s (%5.1fx)" % (
+            capacity, 1 / legacy_insert, 1 / insert, legacy_insert / insert, config['batch_size'], 1 / legacy_sample, 1 / sample_time, legacy_sample / sample_time))
+        del legacy, memory
+
+    buffer = full_memories(1, sample)[1]._samples
+    print("bytes per sample - list: %d - arrays: %d - samples in 1 GB: list %d, arrays %d" % (
+        sample_bytes(sample), buffer_bytes(buffer), 2**30 // sample_bytes(sample), 2**30 // buffer_bytes(buffer)))
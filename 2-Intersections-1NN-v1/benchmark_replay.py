@@ -0,0 +1,102 @@
+import timeit
+import numpy as np
+
+from training_simulation import Simulation
+from memory import Memory
+from utils import import_train_configuration
+
+BATCH_SIZES = [100, 1000, 4096]
+MEMORY_SIZE = 10000
+REPEATS = 10
+
+
+class RecordingModel:  # predicts with the model but keeps the training arrays instead of training, so that the targets can be compared
+    def __init__(self, Model):
+        self._Model = Model
+        self.trained = None
+
+
+    def predict_batch(self, states):
+        return self._Model.predict_batch(states)
+
+
+    def train_batch(self, states, q_sa, weights=None):
+        self.trained = (np.array(states), np.array(q_sa))
+
+
+    @property
+    def batch_size(self):
+        return self._Model.batch_size
+
+
+def legacy_replay(simulation):
+    """
+    Simulation._replay as it was written before the compiled replays, one python loop over the samples, kept as reference
+    """
+    batch = list(zip(*simulation._Memory.get_samples(simulation._Model.batch_size)))  # one tuple for each sample, as the list memory returned them
+
+    if len(batch) > 0:
+        states = np.array([val[0] for val in batch])
+        next_states = np.array([val[3] for val in batch])
+
+        q_s_a = simulation._Model.predict_batch(states)
+        q_s_a_d = simulation._Model.predict_batch(next_states)
+
+        x = np.zeros((len(batch), simulation._num_states))
+        y = np.zeros((len(batch), simulation._num_actions))
+
+        for i, b in enumerate(batch):
+            state, action, reward, _ = b[0], b[1], b[2], b[3]
+            current_q = q_s_a[i]
+            current_q[action] = reward + simulation._gamma * np.amax(q_s_a_d[i])
+            x[i] = state
+            y[i] = current_q
+
+        simulation._Model.train_batch(x, y)
+
+
+def compiled_replay(simulation):
+    """
+    One replay of Simulation.train, through the compiled loop of the model, returns the td errors of the samples
+    """
+    states, actions, rewards, next_states, weights = [field[None] for field in simulation._Memory.get_samples(simulation._Model.batch_size)[:5]]  # a stack of one batch
+    return simulation._Model.train_replays(states, actions, rewards, next_states, weights, simulation._gamma)[0]
+
+
+def random_memory(config, rng):
+    """
+    Memory filled with random samples, binary cell occupancy states
+    """
+    memory = Memory(MEMORY_SIZE, 0)
+    for _ in range(MEMORY_SIZE):
+        state, next_state = (rng.random((2, config['num_states'])) < 0.1).astype(float)
+        memory.add_sample((state, int(rng.integers(config['num_actions'])), float(rng.integers(-500, 50)), next_state))
+    return memory
+
+
+if __name__ == "__main__":
+
+    from model import TrainModel
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    memory = random_memory(config, np.random.default_rng(0))
+
+    for batch_size in BATCH_SIZES:
+        Model = TrainModel(config['num_layers'], config['width_layers'], batch_size, config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'])
+
+        # equivalence with the original replay, on the same batch and weights: the td errors of the compiled loop are computed before its train step
+        recording = Simulation(RecordingModel(Model), memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], 0, 0)
+        memory.seed(batch_size)
+        legacy_replay(recording)
+        legacy_x, legacy_y = recording._Model.trained
+        memory.seed(batch_size)
+        actions = memory.get_samples(batch_size)[1]  # the same batch again
+        legacy_td_errors = (legacy_y - Model.predict_batch(legacy_x))[np.arange(len(legacy_x)), actions]
+        memory.seed(batch_size)
+        simulation = Simulation(Model, memory, None, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], 0, 0)
+        assert np.allclose(legacy_td_errors, compiled_replay(simulation), atol=1e-3)
+
+        # time per call, training included
+        legacy_time = timeit.timeit(lambda: legacy_replay(simulation), number=REPEATS) / REPEATS
+        replay_time = timeit.timeit(lambda: compiled_replay(simulation), number=REPEATS) / REPEATS
+        print("batch %5d - original: %8.1f ms - compiled: %8.1f ms - speedup: %.2fx" % (batch_size, legacy_time * 1000, replay_time * 1000, legacy_time / replay_time))
@@ -0,0 +1,149 @@
+import os
+import timeit
+import numpy as np
+
+from state_encoder import StateEncoder, LANE_GROUPS, CELL_BOUNDARIES, EDGE_CELL_BOUNDARIES
+
+NET_FILE = os.path.join('intersection', 'environment.net.xml')
+NUM_STATES = 160
+VEHICLE_COUNTS = [100, 1000, 5000]
+OTHER_LANES = ["TL2N_0", "TL2S_2", "E0_1", "E3_2", "E4_3", ":TL_0_0", ":DE_12_1"]  # lanes that are not part of the state
+
+
+def legacy_encode(lane_ids, lane_positions):
+    """
+    Cell encoding as it was written in Simulation._get_state before the StateEncoder, kept as reference
+    """
+    state = np.zeros(NUM_STATES)
+
+    for lane_id, lane_pos in zip(lane_ids, lane_positions):
+        lane_pos = 750 - lane_pos
+
+        if lane_id == 'E2TL' or lane_id == 'TL2E':  # compares a lane id with an edge id, never true
+            if lane_pos < 7:
+                lane_cell = 0
+            elif lane_pos < 20:
+                lane_cell = 1
+            elif lane_pos < 40:
+                lane_cell = 2
+            elif lane_pos < 100:
+                lane_cell = 3
+            elif lane_pos < 200:
+                lane_cell = 4
+            elif lane_pos < 400:
+                lane_cell = 5
+            elif lane_pos < 600:
+                lane_cell = 6
+            elif lane_pos < 700:
+                lane_cell = 7
+            elif lane_pos < 730:
+                lane_cell = 8
+            elif lane_pos <= 750:
+                lane_cell = 9
+        else:
+            if lane_pos < 7:
+                lane_cell = 0
+            elif lane_pos < 14:
+                lane_cell = 1
+            elif lane_pos < 21:
+                lane_cell = 2
+            elif lane_pos < 28:
+                lane_cell = 3
+            elif lane_pos < 40:
+                lane_cell = 4
+            elif lane_pos < 60:
+                lane_cell = 5
+            elif lane_pos < 100:
+                lane_cell = 6
+            elif lane_pos < 160:
+                lane_cell = 7
+            elif lane_pos < 400:
+                lane_cell = 8
+            elif lane_pos <= 750:
+                lane_cell = 9
+
+        if lane_id == "W2TL_0" or lane_id == "W2TL_1" or lane_id == "W2TL_2":
+            lane_group = 0
+        elif lane_id == "W2TL_3":
+            lane_group = 1
+        elif lane_id == "N2TL_0" or lane_id == "N2TL_1" or lane_id == "N2TL_2":
+            lane_group = 2
+        elif lane_id == "N2TL_3":
+            lane_group = 3
+        elif lane_id == "E2TL_0" or lane_id == "E2TL_1" or lane_id == "E2TL_2":
+            lane_group = 4
+        elif lane_id == "E2TL_3":
+            lane_group = 5
+        elif lane_id == "S2TL_0" or lane_id == "S2TL_1" or lane_id == "S2TL_2":
+            lane_group = 6
+        elif lane_id == "S2TL_3":
+            lane_group = 7
+        elif lane_id == "-E0_0" or lane_id == "-E0_1" or lane_id == "-E0_2":
+            lane_group = 8
+        elif lane_id == "-E0_3":
+            lane_group = 9
+        elif lane_id == "-E3_0" or lane_id == "-E3_1" or lane_id == "-E3_2":
+            lane_group = 10
+        elif lane_id == "-E3_3":
+            lane_group = 11
+        elif lane_id == "-E4_0" or lane_id == "-E4_1" or lane_id == "-E4_2":
+            lane_group = 12
+        elif lane_id == "-E4_3":
+            lane_group = 13
+        elif lane_id == "TL2E_0" or lane_id == "TL2E_1" or lane_id == "TL2E_2":
+            lane_group = 14
+        elif lane_id == "TL2E_3":
+            lane_group = 15
+        else:
+            lane_group = -1
+
+        if lane_group >= 1 and lane_group <= 15:
+            car_position = int(str(lane_group) + str(lane_cell))
+            valid_car = True
+        elif lane_group == 0:
+            car_position = lane_cell
+            valid_car = True
+        else:
+            valid_car = False
+
+        if valid_car:
+            state[car_position] = 1
+
+    return state
+
+
+def random_vehicles(n, rng):
+    """
+    Draw n cars on random lanes and positions, including the cell boundaries and lanes outside of the state
+    """
+    lanes = list(LANE_GROUPS) + OTHER_LANES
+    lane_ids = [lanes[i] for i in rng.integers(0, len(lanes), size=n)]
+    lane_positions = rng.uniform(0, 750, size=n)
+    on_boundary = rng.random(n) < 0.2
+    lane_positions[on_boundary] = 750 - rng.choice([0] + CELL_BOUNDARIES + [750], size=on_boundary.sum())
+    return lane_ids, lane_positions.tolist()
+
+
+if __name__ == "__main__":
+
+    rng = np.random.default_rng(0)
+    encoder = StateEncoder(NET_FILE, NUM_STATES, LANE_GROUPS, CELL_BOUNDARIES, EDGE_CELL_BOUNDARIES)
+    legacy_encoder = StateEncoder(NET_FILE, NUM_STATES, LANE_GROUPS, CELL_BOUNDARIES, lane_length=750)  # same geometry as the original encoding
+
+    # equivalence with the original encoding
+    changed = 0
+    for _ in range(2000):
+        lane_ids, lane_positions = random_vehicles(int(rng.integers(0, 200)), rng)
+        legacy_state = legacy_encode(lane_ids, lane_positions)
+        assert np.array_equal(legacy_encoder.encode(lane_ids, lane_positions), legacy_state)
+        changed += not np.array_equal(encoder.encode(lane_ids, lane_positions), legacy_state)
+    print("StateEncoder with 750 m lanes matches the original encoding on 2000 random states")
+    print("Real lane lengths and middle road cells change", changed, "of them")
+
+    # time per call
+    for n in VEHICLE_COUNTS:
+        lane_ids, lane_positions = random_vehicles(n, rng)
+        repeats = max(10, 20000 // n)
+        legacy_time = timeit.timeit(lambda: legacy_encode(lane_ids, lane_positions), number=repeats) / repeats
+        encoder_time = timeit.timeit(lambda: encoder.encode(lane_ids, lane_positions), number=repeats) / repeats
+        print("%5d vehicles - original: %8.1f us - StateEncoder: %8.1f us - speedup: %.1fx" % (n, legacy_time * 1e6, encoder_time * 1e6, legacy_time / encoder_time))
@@ -0,0 +1,69 @@
+import os
+import timeit
+
+from utils import select_backend, import_train_configuration, set_sumo
+
+select_backend('training_settings.ini')  # before the modules that control sumo are imported
+
+from training_simulation import Simulation
+from environment import Environment
+from generator import TrafficGenerator
+from memory import Memory
+from model import TrainModel
+from vectorized_simulation import VectorizedSimulation
+
+ENVIRONMENTS = [1, 2, 4, 8, 16]
+EPSILON = 0.5  # half of the decisions use the predicted action values, all of them are predicted in lockstep
+
+
+class SampleCounter:  # stands for the Memory of the reference Simulation, one sample is added for every decision but the first
+    def __init__(self):
+        self.samples = 0
+
+
+    def add_sample(self, sample, *agent_id):
+        self.samples += 1
+
+
+def serial_decisions_per_second(config, Model):
+    """
+    Decisions per second of one Simulation that predicts every decision on its own with predict_one, as reference, after a warmup episode
+    """
+    memory = SampleCounter()
+    sumo_cmd = set_sumo(False, config['sumocfg_file_name'], config['max_steps'])
+    traffic_gen = TrafficGenerator(memory, config['max_steps'], config['n_cars_generated'])
+    environment = Environment(traffic_gen, sumo_cmd, config['max_steps'], config['green_duration'], config['yellow_duration'], config['num_states'],
+                              config['reward'], config['observation'], config['persistent_sumo'])
+    simulation = Simulation(Model, memory, environment, config['gamma'], config['max_steps'], config['num_states'], config['num_actions'], 0, 0)
+
+    simulation.run(0, EPSILON)  # starts sumo and traces the compiled prediction
+    memory.samples = 0
+    start_time = timeit.default_timer()
+    simulation.run(1, EPSILON)
+    decisions_per_second = memory.samples / (timeit.default_timer() - start_time)
+    simulation.close()
+    return decisions_per_second
+
+
+if __name__ == "__main__":
+
+    config = import_train_configuration(config_file='training_settings.ini')
+    config['mode'] = 0
+    Model = TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'], input_dim=config['num_states'], output_dim=config['num_actions'])
+    print("%d cpus, %d steps per episode" % (os.cpu_count(), config['max_steps']))
+
+    reference = serial_decisions_per_second(config, Model)
+    print("serial predict_one   %8.1f decisions/s" % reference)
+
+    single = None
+    for environments in ENVIRONMENTS:
+        config['actors'] = environments
+        memory = Memory(config['memory_size_max'], config['memory_size_min'])
+        vectorized = VectorizedSimulation(config, Model, memory)
+        vectorized.run(list(range(environments)), [EPSILON] * environments)  # warmup round, with the startup of the environment processes and their sumo
+        vectorized.run(list(range(environments, 2 * environments)), [EPSILON] * environments)
+        vectorized.close()
+
+        single = single or vectorized.decisions_per_second
+        print("lockstep %2d envs     %8.1f decisions/s - speedup %5.2fx - scaling efficiency %3.0f%%" % (
+            environments, vectorized.decisions_per_second, vectorized.decisions_per_second / reference, 100 * vectorized.decisions_per_second / (single * environments)))
@@ -0,0 +1,92 @@
+import collections
+import threading
+import numpy as np
+
+
+class DecisionCache:  # LRU cache of the action values in front of predict_one, keyed by the bit-packed binary occupancy state
+    def __init__(self, Model, size):
+        self._Model = Model
+        self._size = size
+        self._values = collections.OrderedDict()
+        self._generation = 0  # number of changes of the weights, the values predicted meanwhile are not cached
+        self._lock = threading.Lock()  # the async learner publishes its weights from its own thread
+        self._hits = 0
+        self._misses = 0
+
+
+    def __getattr__(self, name):
+        return getattr(self._Model, name)  # the rest of the interface of the model
+
+
+    def predict_one(self, state, *agent_id):
+        """
+        Predict the action values from a single state, only the states not seen since the last change of the weights reach the model
+        """
+        key = (np.packbits(np.asarray(state) != 0).tobytes(),) + agent_id
+        with self._lock:
+            values = self._values.get(key)
+            if values is not None:
+                self._values.move_to_end(key)
+                self._hits += 1
+                return values.copy()
+            generation = self._generation
+
+        values = self._Model.predict_one(state, *agent_id)
+        with self._lock:
+            if generation == self._generation:
+                self._values[key] = values.copy()
+                if len(self._values) > self._size:
+                    self._values.popitem(last=False)  # the least recently used state
+            self._misses += 1
+        return values
+
+
+    def _invalidate(self):
+        """
+        Empty the cache after a change of the weights of the model
+        """
+        with self._lock:
+            self._values.clear()
+            self._generation += 1
+
+
+    def train_batch(self, *args):
+        self._Model.train_batch(*args)
+        self._invalidate()
+
+
+    def train_replays(self, *args):
+        td_errors = self._Model.train_replays(*args)
+        self._invalidate()
+        return td_errors
+
+
+    def set_weights(self, weights):
+        self._Model.set_weights(weights)
+        self._invalidate()
+
+
+    def hit_rate(self):
+        """
+        Percentage of the predictions answered by the cache since the last reset of the counters
+        """
+        return round(100 * self._hits / max(self._hits + self._misses, 1), 2)
+
+
+    def reset_stats(self):
+        """
+        Reset the counters of hits and misses, e.g. at the start of every episode
+        """
+        self._hits = 0
+        self._misses = 0
+
+
+    def cache_report(self):
+        """
+        Lines of the report of the cache: decisions, hits and hit rate since the last reset of the counters, and states cached
+        """
+        return [
+            "decisions: %d" % (self._hits + self._misses),
+            "answered by the cache: %d (%.2f %%)" % (self._hits, self.hit_rate()),
+            "states cached: %d of %d" % (len(self._values), self._size)
+        ]
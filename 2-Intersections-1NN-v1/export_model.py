@@ -0,0 +1,24 @@
+import numpy as np
+
+from model import TestModel
+from numpy_model import NumpyTestModel
+from utils import import_test_configuration, set_test_path
+
+STATES = 200  # random states checked after the export
+
+
+if __name__ == "__main__":
+
+    # export the weights of the model to test, for the models saved before the .npz file was saved with them
+    config = import_test_configuration(config_file='testing_settings.ini')
+    model_path, _ = set_test_path(config['models_path_name'], config['model_to_test'])
+    Model = TestModel(input_dim=config['num_states'], model_path=model_path)
+    Model.export_weights(model_path)
+
+    # equivalence with the tensorflow model
+    NumpyModel = NumpyTestModel(input_dim=config['num_states'], model_path=model_path)
+    states = (np.random.default_rng(0).random((STATES, config['num_states'])) < 0.1).astype(float)  # cell occupancy states
+    for state in states:
+        assert np.allclose(NumpyModel.predict_one(state), Model.predict_one(state), atol=1e-4)
+        assert np.argmax(NumpyModel.predict_one(state)) == np.argmax(Model.predict_one(state))
+    print("Weights exported at:", model_path, "- the numpy model matches the tensorflow one on", STATES, "random states")
@@ -1,27 +1,338 @@
-import random
+import os
+import sys
+import numpy as np
+
+PRIORITY_EPSILON = 0.01  # added to the absolute td errors, so that no transition gets a zero probability
+
+
+class SumTree:  # binary tree in an array, the leaves hold the priorities of the transitions and every node the sum of its two children
+    def __init__(self, size, array=np.zeros):
+        self._leaves = 1 << max(size - 1, 0).bit_length()  # a power of two, node i has the children 2i and 2i+1, the root is node 1
+        self._depth = self._leaves.bit_length() - 1
+        self._nodes = array(2 * self._leaves)  # float64, in RAM or memory-mapped
+
+
+    def set(self, position, priority):
+        """
+        Set the priority of one leaf and update the sums up to the root, O(log n)
+        """
+        node = position + self._leaves
+        self._nodes[node] = priority
+        for _ in range(self._depth):
+            node //= 2
+            self._nodes[node] = self._nodes[2 * node] + self._nodes[2 * node + 1]
+
+
+    def update(self, positions, priorities):
+        """
+        Set the priorities of a batch of leaves and update the sums level by level up to the root, O(log n) for each leaf
+        """
+        nodes = np.asarray(positions) + self._leaves
+        self._nodes[nodes] = priorities
+        for _ in range(self._depth):
+            nodes = np.unique(nodes // 2)  # the leaves of a batch share their ancestors
+            self._nodes[nodes] = self._nodes[2 * nodes] + self._nodes[2 * nodes + 1]
+
+
+    def find(self, values):
+        """
+        Return the leaves where the given values fall in the cumulative sum of the priorities, descending the tree for all of them at once, O(log n)
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self._depth):
+            left = 2 * nodes
+            right = (values >= self._nodes[left]) & (self._nodes[left + 1] > 0)  # never towards an empty subtree because of rounding
+            values = np.where(right, values - self._nodes[left], values)
+            nodes = np.where(right, left + 1, left)
+        return nodes - self._leaves
+
+
+    def get(self, positions):
+        return self._nodes[positions + self._leaves]
+
+
+    def max(self):
+        return self._nodes[self._leaves:].max()
+
+
+    @property
+    def total(self):
+        return self._nodes[1]
+
+
+class ReplayBuffer:  # transitions in preallocated arrays written in a ring once full, every observation is stored once and the transitions point to it
+    def __init__(self, size_max, path=None, readonly=False):
+        self._size_max = size_max
+        self._path = path  # folder of the memory-mapped files of the arrays, that outlive the session, None keeps the arrays in RAM
+        self._readonly = readonly  # e.g. another process reading the buffer while the training writes it
+        self._mapped_arrays = []
+        if path is not None and not readonly:
+            os.makedirs(path, exist_ok=True)
+
+        self._counters = self._array('counters', (4,), np.int64)  # first, size, observation position and number of states, in the files with the arrays
+        if self._num_states == 0 and not readonly:  # a new buffer
+            self._observation_position = -1
+        self._observations_max = 2 * size_max  # within an episode the next state of a transition is the state of the following one, the episodes of several actors interleave and take up to two each
+        self._observations = None  # allocated with the first sample, that gives the size of the states
+        self._last_observation = None  # packed bytes of the last observation, compared with the state of the next sample
+        if self._num_states > 0:  # a buffer of a previous session
+            self._allocate(self._num_states)
+            self._last_observation = self._observations[self._observation_position].tobytes()
+        self._state_positions = self._array('state_positions', (size_max,), np.int32)  # observation of the state of each transition, its next state is the following observation
+        self._actions = self._array('actions', (size_max,), np.int32)
+        self._rewards = self._array('rewards', (size_max,), np.float32)
+        self._generations = self._array('generations', (size_max,), np.int64)  # number of transitions written in each position so far
+        self._rng = np.random.default_rng()
+
+
+    def _array(self, name, shape, dtype):
+        """
+        Return an array of zeros of the buffer, or with a path its memory-mapped .npy file, created if it does not exist yet:
+        the operating system pages it in and out, the whole buffer is never loaded in RAM
+        """
+        if self._path is None:
+            return np.zeros(shape, dtype=dtype)
+
+        file_path = os.path.join(self._path, name + '.npy')
+        if os.path.isfile(file_path):
+            array = np.load(file_path, mmap_mode='r' if self._readonly else 'r+')
+            if array.shape != shape or array.dtype != dtype:
+                sys.exit('The replay memory in ' + self._path + ' does not match memory_size_max and the settings of the memory')
+        elif self._readonly:
+            sys.exit('The replay memory to read does not exist in ' + self._path)
+        else:
+            array = np.lib.format.open_memmap(file_path, mode='w+', dtype=dtype, shape=shape)
+        self._mapped_arrays.append(array)
+        return array
+
+
+    def _allocate(self, num_states):
+        """
+        Allocate the array of the observations, the cell occupancy is 0 or 1 so they are stored packed, 8 cells in each byte
+        """
+        self._observations = self._array('observations', (self._observations_max, (num_states + 7) // 8), np.uint8)
+
+
+    def add(self, sample):
+        """
+        Write the sample (state, action, reward, next state) over the oldest one if the buffer is full, in constant time,
+        the state is written only at the start of an episode, otherwise it is the next state of the previous sample
+        """
+        state, action, reward, next_state = sample
+        if self._observations is None:
+            self._allocate(len(state))
+            self._num_states = len(state)  # once the array exists, for the processes reading the buffer
+
+        packed_state = np.packbits(np.asarray(state, dtype=np.uint8))
+        if packed_state.tobytes() != self._last_observation:  # a new episode
+            self._add_observation(packed_state)
+        state_position = self._observation_position
+        self._add_observation(np.packbits(np.asarray(next_state, dtype=np.uint8)))
+
+        if self._size == self._size_max:
+            self._remove_oldest()
+        position = (self._first + self._size) % self._size_max
+        self._state_positions[position] = state_position
+        self._actions[position] = action
+        self._rewards[position] = reward
+        self._generations[position] += 1
+        self._size += 1
+        return position
+
+
+    def _add_observation(self, packed_observation):
+        """
+        Write the observation over the oldest one, the transition whose state it was is removed with it
+        """
+        self._observation_position = (self._observation_position + 1) % self._observations_max
+        if self._size > 0 and self._state_positions[self._first] == self._observation_position:  # only the oldest transition can point to the oldest observation
+            self._remove_oldest()
+        self._observations[self._observation_position] = packed_observation
+        self._last_observation = packed_observation.tobytes()
+
+
+    def _remove_oldest(self):
+        self._first = (self._first + 1) % self._size_max
+        self._size -= 1
+
+
+    def sample(self, n):
+        """
+        Return n random samples, or all of them if there are less, as one array for each field: states, actions, rewards and next states,
+        followed by their importance-sampling weights, all 1 with uniform draws, and their ids for the update of the priorities
+        """
+        indices = (self._first + self._rng.choice(self._size, min(n, self._size), replace=False)) % self._size_max
+        return self._transitions(indices) + (np.ones(len(indices), dtype=np.float32), self._ids(indices))
+
+
+    def _ids(self, indices):
+        """
+        Identify the transitions at the given positions by their position and the generation of their write, generation * size_max + position,
+        a transition written later in the same position gets another id
+        """
+        return self._generations[indices] * self._size_max + indices
+
+
+    def _transitions(self, indices):
+        """
+        Read the transitions at the given positions, one array for each field
+        """
+        if self._observations is None and self._num_states > 0:  # written meanwhile by the process that adds the samples
+            self._allocate(self._num_states)
+        state_positions = self._state_positions[indices]
+        next_state_positions = (state_positions + 1) % self._observations_max
+        return self._unpack(self._observations[state_positions]), self._actions[indices], self._rewards[indices], self._unpack(self._observations[next_state_positions])
+
+
+    def _unpack(self, packed_states):
+        """
+        Unpack the sampled states to the float cell occupancy of the model
+        """
+        return np.unpackbits(packed_states, axis=1, count=self._num_states).astype(np.float32)
+
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Nothing to update with uniform draws
+        """
+        pass
+
+
+    def seed(self, seed):
+        """
+        Seed the draws of the samples, for reproducible batches
+        """
+        self._rng = np.random.default_rng(seed)
+
+
+    def flush(self):
+        """
+        Write the changes of the memory-mapped arrays to their files, e.g. at the end of the session
+        """
+        for array in self._mapped_arrays:
+            array.flush()
+
+
+    @property
+    def size(self):
+        return self._size
+
+
+    @property
+    def _first(self):  # oldest transition, overwritten first
+        return int(self._counters[0])
+
+
+    @_first.setter
+    def _first(self, value):
+        self._counters[0] = value
+
+
+    @property
+    def _size(self):
+        return int(self._counters[1])
+
+
+    @_size.setter
+    def _size(self, value):
+        self._counters[1] = value
+
+
+    @property
+    def _observation_position(self):  # of the last observation written
+        return int(self._counters[2])
+
+
+    @_observation_position.setter
+    def _observation_position(self, value):
+        self._counters[2] = value
+
+
+    @property
+    def _num_states(self):  # 0 until the first sample
+        return int(self._counters[3])
+
+
+    @_num_states.setter
+    def _num_states(self, value):
+        self._counters[3] = value
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):  # draws the transitions with a probability that grows with their last td error, from a sum-tree of the priorities
+    def __init__(self, size_max, alpha, beta, path=None, readonly=False):
+        super().__init__(size_max, path, readonly)
+        self._tree = SumTree(size_max, lambda size: self._array('priorities', (size,), np.float64))
+        self._alpha = alpha  # 0 gives uniform draws
+        self._beta = beta  # 1 corrects completely the bias of the draws in the training
+        self._max_priority = max(1.0, self._tree.max())  # of the new transitions, so that each of them is replayed at least once with a high probability
+
+
+    def add(self, sample):
+        position = super().add(sample)
+        self._tree.set(position, self._max_priority)
+        return position
+
+
+    def _remove_oldest(self):
+        self._tree.set(self._first, 0)
+        super()._remove_oldest()
+
+
+    def sample(self, n):
+        """
+        Return n samples drawn in proportion to their priority, one in each of n equal segments of the total priority,
+        with their importance-sampling weights normalized by the largest one
+        """
+        k = min(n, self._size)
+        values = (np.arange(k) + self._rng.random(k)) * (self._tree.total / k)
+        indices = self._tree.find(values)
+        weights = (self._size * self._tree.get(indices) / self._tree.total) ** -self._beta
+        return self._transitions(indices) + ((weights / weights.max()).astype(np.float32), self._ids(indices))
+
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Set the priorities of the replayed transitions, given by their ids, from their new td errors,
+        the ones removed since they were drawn are skipped, also when another transition was written in their position meanwhile
+        """
+        positions = indices % self._size_max
+        live = (self._generations[positions] == indices // self._size_max) & ((positions - self._first) % self._size_max < self._size)
+        priorities = (np.abs(td_errors[live]) + PRIORITY_EPSILON) ** self._alpha
+        if len(priorities) > 0:
+            self._tree.update(positions[live], priorities)
+            self._max_priority = max(self._max_priority, priorities.max())
+
 
 class Memory:    # saves and manages data from simulations
-    def __init__(self, size_max, size_min):
-        self._samples = []
+    def __init__(self, size_max, size_min, prioritized=False, alpha=0.6, beta=0.4, path=None, readonly=False):
+        # with a path the samples are kept in memory-mapped files, that the next sessions resume and other processes can read
+        self._samples = PrioritizedReplayBuffer(size_max, alpha, beta, path, readonly) if prioritized else ReplayBuffer(size_max, path, readonly)
         self._size_max = size_max
         self._size_min = size_min
 
 
     def add_sample(self, sample):
-        self._samples.append(sample)
-        if self._size_now() > self._size_max:
-            self._samples.pop(0)  # if the length is greater than the size of memory, remove the oldest element
+        self._samples.add(sample)  # if the memory is full, the oldest element is replaced
 
 
     def get_samples(self, n):
         if self._size_now() < self._size_min:
-            return []
+            return ()
 
-        if n > self._size_now():
-            return random.sample(self._samples, self._size_now())  # get all the samples
-        else:
-            return random.sample(self._samples, n)  # get "batch size" number of samples
+        return self._samples.sample(n)  # get "batch size" number of samples, or all the samples, as ready to use arrays
+
+
+    def update_priorities(self, indices, td_errors):
+        self._samples.update_priorities(indices, td_errors)  # with the td errors of the replay of the samples
+
+
+    def seed(self, seed):
+        self._samples.seed(seed)
+
+
+    def flush(self):
+        self._samples.flush()
 
 
     def _size_now(self):
-        return len(self._samples)
\ No newline at end of file
+        return self._samples.size
@@ -0,0 +1,66 @@
+import functools
+
+from sumo_backend import traci
+
+
+class ObservationCache:
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        """
+        Empty the cache and its counters, to be called every time a new simulation is started
+        """
+        self._values = {}
+        self._calls = {}
+        self._steps = 0
+        self._traci_calls = 0  # calls sent to sumo to fill the cache
+        self._saved_calls = 0  # calls that would have been sent again without the cache
+
+
+    def step(self):
+        """
+        Simulate 1 step in sumo, every value read before is outdated after it
+        """
+        traci.simulationStep()
+        self._values = {}
+        self._steps += 1
+
+
+    def get(self, key, read, calls):
+        """
+        Return the value of the given key for the current step, only the first request of every step reaches sumo
+        """
+        if key in self._values:
+            self._saved_calls += self._calls[key]
+            return self._values[key]
+
+        value = read()
+        self._values[key] = value
+        self._calls[key] = calls(value) if callable(calls) else calls
+        self._traci_calls += self._calls[key]
+        return value
+
+
+    def summary(self):
+        """
+        Average number of TraCI calls sent and saved per simulation step
+        """
+        steps = max(self._steps, 1)
+        return "TraCI calls per step: " + str(round(self._traci_calls / steps, 2)) + " - saved by the observation cache: " + str(round(self._saved_calls / steps, 2))
+
+
+def cached_observation(calls):
+    """
+    Decorator for the Environment methods that read from sumo, so that each of them reaches sumo at most once per step for the same arguments,
+    calls is the number of TraCI calls of one read, or a function of the Environment and of the read value that returns it
+    """
+    def decorator(read):
+        @functools.wraps(read)
+        def wrapper(environment, *args):
+            key = (read.__name__,) + tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+            read_calls = (lambda value: calls(environment, value)) if callable(calls) else calls
+            return environment._ObservationCache.get(key, lambda: read(environment, *args), read_calls)
+        return wrapper
+    return decorator
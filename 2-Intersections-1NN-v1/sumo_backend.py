@@ -0,0 +1,17 @@
+import os
+import sys
+
+import traci
+import traci.constants as tc
+
+# the library that controls sumo, selected once per process when this module is first imported, every module calls sumo through it:
+# traci talks to a separate sumo process, libsumo runs sumo inside this process with the same api but without gui.
+# The entry points set SUMO_BACKEND from their settings with select_backend before importing the modules that use it,
+# the processes they spawn inherit it
+BACKENDS = ('traci', 'libsumo')
+BACKEND = os.environ.get('SUMO_BACKEND', 'traci')
+
+if BACKEND not in BACKENDS:
+    sys.exit("backend must be traci or libsumo, not '" + BACKEND + "'")
+if BACKEND == 'libsumo':
+    import libsumo as traci
@@ -0,0 +1,90 @@
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+import pytest
+
+from benchmark_state import legacy_encode
+from state_encoder import StateEncoder, LANE_GROUPS, CELL_BOUNDARIES, EDGE_CELL_BOUNDARIES, cell_geometry
+
+NET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intersection', 'environment.net.xml')
+NUM_STATES = 160
+
+
+def net_lane_lengths():
+    """
+    Length of every lane of environment.net.xml, read independently of the StateEncoder
+    """
+    return {lane.get('id'): float(lane.get('length')) for lane in ET.parse(NET_FILE).getroot().iter('lane')}
+
+
+def encoder(lane_groups, road_geometry):
+    edge_cell_boundaries, lane_length = cell_geometry(road_geometry)
+    return StateEncoder(NET_FILE, NUM_STATES, lane_groups, CELL_BOUNDARIES, edge_cell_boundaries, lane_length)
+
+
+def random_vehicles(n, rng, lane_groups, lengths):
+    """
+    Draw n cars on the lanes of the state, anywhere between the start and the end of the real lane
+    """
+    lanes = list(lane_groups)
+    lane_ids = [lanes[i] for i in rng.integers(0, len(lanes), size=n)]
+    lane_positions = rng.uniform(0, 1, size=n) * np.array([lengths[lane_id] for lane_id in lane_ids])
+    return lane_ids, lane_positions.tolist()
+
+
+def test_net_lane_lengths():
+    lengths = net_lane_lengths()
+    for road_id in ["-E0", "-E3", "-E4"]:  # the roads of the second intersection that are shorter than 750 m
+        assert all(731 <= lengths[road_id + "_" + str(i)] <= 734 for i in range(4))
+    for road_id in ["E2TL", "N2TL", "W2TL", "S2TL", "TL2E"]:
+        assert all(lengths[road_id + "_" + str(i)] == 750 for i in range(4))
+
+
+def test_legacy_geometry_is_the_default_encoding():
+    """
+    The default road geometry gives the states of the original encoding, that the shipped models were trained with
+    """
+    lengths = net_lane_lengths()
+    legacy = encoder(LANE_GROUPS, 'legacy')
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        lane_ids, lane_positions = random_vehicles(int(rng.integers(0, 200)), rng, LANE_GROUPS, lengths)
+        assert np.array_equal(legacy.encode(lane_ids, lane_positions), legacy_encode(lane_ids, lane_positions))
+
+
+def test_net_geometry_measures_from_the_real_stop_line():
+    """
+    With the net geometry a car at the end of its lane is in the first cell of its lane group, and at its start in the last cell,
+    25 m before the traffic light it is in the third cell of the middle roads and in the fourth cell of the others
+    """
+    lengths = net_lane_lengths()
+    net = encoder(LANE_GROUPS, 'net')
+    for lane_id, group in LANE_GROUPS.items():
+        assert np.flatnonzero(net.encode([lane_id], [lengths[lane_id]])).tolist() == [group * 10]
+        assert np.flatnonzero(net.encode([lane_id], [0])).tolist() == [group * 10 + 9]
+        assert np.flatnonzero(net.encode([lane_id], [lengths[lane_id] - 25])).tolist() == [group * 10 + (2 if lane_id.rsplit("_", 1)[0] in EDGE_CELL_BOUNDARIES else 3)]
+
+
+def test_net_geometry_changes_the_states_of_the_second_intersection():
+    lengths = net_lane_lengths()
+    net, legacy = encoder(LANE_GROUPS, 'net'), encoder(LANE_GROUPS, 'legacy')
+    car = ["-E0_0"], [lengths["-E0_0"]]  # at the stop line, 16 m from the end of a 750 m road
+    assert not np.array_equal(net.encode(*car), legacy.encode(*car))
+
+
+@pytest.mark.parametrize("road_geometry", ['legacy', 'net'])
+def test_cells_stay_on_their_lane(road_geometry):
+    """
+    The lane area detectors of the cells fit on the real lanes, and a car on a detector is in the cell of the detector
+    """
+    lengths = net_lane_lengths()
+    state_encoder = encoder(LANE_GROUPS, road_geometry)
+    for lane_id, index, start_pos, end_pos in state_encoder.cells():
+        assert 0 <= start_pos < end_pos <= lengths[lane_id]
+        assert np.flatnonzero(state_encoder.encode([lane_id], [(start_pos + end_pos) / 2])).tolist() == [index]
+
+
+def test_unknown_road_geometry():
+    with pytest.raises(SystemExit):
+        cell_geometry('exact')
+
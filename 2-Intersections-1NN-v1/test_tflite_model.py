@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from model import TrainModel
+from tflite_model import TFLiteTestModel
+
+NUM_STATES = 160
+NUM_ACTIONS = 8
+CALIBRATION_STATES = 500
+TEST_STATES = 200
+
+
+def cell_states(n, rng):
+    """
+    Draw n states of occupied and empty cells, as the state encoder gives them
+    """
+    return rng.integers(0, 2, size=(n, NUM_STATES)).astype(np.float32)
+
+
+@pytest.fixture(scope='module')
+def models(tmp_path_factory):
+    """
+    A float model and its int8 TFLite export, calibrated as at the end of the training on a batch of states of the memory
+    """
+    path = str(tmp_path_factory.mktemp('model'))
+    rng = np.random.default_rng(0)
+    tf.keras.utils.set_random_seed(0)
+    Model = TrainModel(2, 64, 100, 0.001, NUM_STATES, NUM_ACTIONS)
+    Model.export_tflite(path, (cell_states(CALIBRATION_STATES, rng),))
+    return Model, TFLiteTestModel(NUM_STATES, path)
+
+
+def test_tflite_model_follows_the_float_model(models):
+    """
+    The quantized action values stay on average within a few percent of the float ones, and the actions taken are the same
+    """
+    Model, TFLiteModel = models
+    states = cell_states(TEST_STATES, np.random.default_rng(1))
+    float_q = np.array([Model.predict_one(state)[0] for state in states])
+    tflite_q = np.array([TFLiteModel.predict_one(state)[0] for state in states])
+    assert tflite_q.shape == (TEST_STATES, NUM_ACTIONS) and tflite_q.dtype == np.float32
+    assert np.mean(np.abs(tflite_q - float_q)) <= 0.02 * np.max(np.abs(float_q))
+    assert np.mean(np.argmax(tflite_q, axis=1) == np.argmax(float_q, axis=1)) >= 0.95
+
+
+def test_missing_tflite_model(tmp_path):
+    with pytest.raises(SystemExit):
+        TFLiteTestModel(NUM_STATES, str(tmp_path))
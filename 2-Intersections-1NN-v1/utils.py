@@ -2,6 +2,7 @@ import configparser
 from sumolib import checkBinary
 import os
 import sys
+import shutil
 
 
 def import_train_configuration(config_file):
@@ -19,15 +20,30 @@ def import_train_configuration(config_file):
     config['yellow_duration'] = content['simulation'].getint('yellow_duration')
     config['mode'] = content['simulation'].getint('mode')
     config['reward'] = content['simulation'].getint('reward')
+    config['observation'] = content['simulation']['observation']
+    config['persistent_sumo'] = content['simulation'].getboolean('persistent_sumo')
+    config['actors'] = content['simulation'].getint('actors')
+    config['lockstep'] = content['simulation'].getboolean('lockstep')
     config['num_layers'] = content['model'].getint('num_layers')
     config['width_layers'] = content['model'].getint('width_layers')
     config['batch_size'] = content['model'].getint('batch_size')
     config['learning_rate'] = content['model'].getfloat('learning_rate')
     config['training_epochs'] = content['model'].getint('training_epochs')
+    config['async_learner'] = content['model'].getboolean('async_learner')
+    config['gradient_steps_per_transition'] = content['model'].getfloat('gradient_steps_per_transition')
+    config['publish_interval'] = content['model'].getint('publish_interval')
+    config['export_tflite'] = content['model'].getboolean('export_tflite')
     config['memory_size_min'] = content['memory'].getint('memory_size_min')
     config['memory_size_max'] = content['memory'].getint('memory_size_max')
+    config['prioritized_replay'] = content['memory'].getboolean('prioritized_replay')
+    config['priority_alpha'] = content['memory'].getfloat('priority_alpha')
+    config['priority_beta'] = content['memory'].getfloat('priority_beta')
+    config['persistent_memory'] = content['memory'].getboolean('persistent_memory')
+    config['resume_memory_from'] = content['memory'].getint('resume_memory_from')
     config['num_states'] = content['agent'].getint('num_states')
     config['num_actions'] = content['agent'].getint('num_actions')
+    config['decision_cache_size'] = content['agent'].getint('decision_cache_size')
+    config['road_geometry'] = content['agent']['road_geometry']
     config['gamma'] = content['agent'].getfloat('gamma')
     config['models_path_name'] = content['dir']['models_path_name']
     config['sumocfg_file_name'] = content['dir']['sumocfg_file_name']
@@ -49,14 +65,32 @@ def import_test_configuration(config_file):
     config['yellow_duration'] = content['simulation'].getint('yellow_duration')
     config['mode'] = content['simulation'].getint('mode')
     config['reward'] = content['simulation'].getint('reward')
+    config['observation'] = content['simulation']['observation']
     config['num_states'] = content['agent'].getint('num_states')
     config['num_actions'] = content['agent'].getint('num_actions')
+    config['inference'] = content['agent']['inference']
+    config['decision_cache_size'] = content['agent'].getint('decision_cache_size')
+    config['road_geometry'] = content['agent']['road_geometry']
     config['sumocfg_file_name'] = content['dir']['sumocfg_file_name']
     config['models_path_name'] = content['dir']['models_path_name']
     config['model_to_test'] = content['dir'].getint('model_to_test') 
     return config
 
 
+def select_backend(config_file):
+    """
+    Select the library that controls sumo from the settings, for this process and the ones it spawns,
+    before sumo_backend is imported by the modules that use it
+    """
+    content = configparser.ConfigParser()
+    content.read(config_file)
+    backend = content['simulation']['backend']
+    if backend == 'libsumo' and content['simulation'].getboolean('gui'):
+        print("libsumo has no gui, sumo-gui is controlled with traci")
+        backend = 'traci'
+    os.environ['SUMO_BACKEND'] = backend
+
+
 def set_sumo(gui, sumocfg_file_name, max_steps):
     """
     Configure various parameters of SUMO
@@ -73,7 +107,7 @@ def set_sumo(gui, sumocfg_file_name, max_steps):
         sumoBinary = checkBinary('sumo')
     else:
         sumoBinary = checkBinary('sumo-gui')
- 
+
     # setting the cmd command to run sumo at simulation time
     sumo_cmd = [sumoBinary, "-c", os.path.join('intersection', sumocfg_file_name), "--no-step-log", "true", "--waiting-time-memory", str(max_steps)]
 
@@ -99,6 +133,19 @@ def set_train_path(models_path_name):
     return data_path 
 
 
+def set_memory_path(models_path_name, data_path, model_n):
+    """
+    Returns the path of the replay memory in the new model path, that starts as a copy of the memory of the model number provided as argument, if not 0
+    """
+    memory_path = os.path.join(data_path, 'replay_memory', '')
+    if model_n > 0:
+        previous_memory_path = os.path.join(os.getcwd(), models_path_name, 'model_'+str(model_n), 'replay_memory', '')
+        if not os.path.isdir(previous_memory_path):
+            sys.exit('The model number to resume the replay memory from has no replay memory')
+        shutil.copytree(previous_memory_path, memory_path)  # file by file, the memory of the previous session stays as it was saved
+    return memory_path
+
+
 def set_test_path(models_path_name, model_n):
     """
     Returns a model path that identifies the model number provided as argument and a newly created 'test' path